@@ -1,52 +1,134 @@
-from flask import Flask, request, jsonify, send_file, make_response
+from flask import Flask, request, jsonify, send_file
 import os
 import json
 import hashlib
-import fitz  # PyMuPDF for PDF text extraction
-import re
-from collections import Counter
-import subprocess
 import sys
 import random
+import re
+import queue
+import threading
+import numpy as np
+from generationEngine import GenerationEngine, GenerationError
+from pdfExtraction import extract_text_by_dynamic_font_size
+from metadataStore import MetadataStore, DEFAULT_USER_ID
+from statsLog import StatsLog
+from lessonProgress import LessonProgress
+from questionIndex import QuestionIndex
+from reviewScheduler import ReviewScheduler
+from questionDedup import question_id
+from questionBank import QuestionBank, write_question_bank, open_question_bank, read_positions, write_positions
+from difficultyScoring import bank_difficulties, stats_arrays, combined_difficulty_scores, difficulty_order
+from processedStore import PROCESSED_FOLDER
+from textStore import TEXTS_FOLDER, MAIN_TEXTS_FOLDER, texts_json_path, main_text_path, save_main_text
+from responseCache import ResponseCache
 
 app = Flask(__name__) # Reverted to standard Flask initialization
 
 RES_FOLDER = "res"
 UPLOAD_FOLDER = os.path.join(RES_FOLDER, "uploads")
-TEXTS_FOLDER = os.path.join(RES_FOLDER, "texts")
 SUBJECTS_FILE = os.path.join(RES_FOLDER, "subjects.json")
 LESSONS_FILE = os.path.join(RES_FOLDER, "lessons.json")
 FILE_RECORD = os.path.join(RES_FOLDER, "files.json")
+TEXT_HASH_RECORD = os.path.join(RES_FOLDER, "text_hashes.json") # content hash -> extracted texts JSON
+METADATA_DB = os.path.join(RES_FOLDER, "metadata.db")
+STATS_LOG_FILE = os.path.join(RES_FOLDER, "stats_events.log")
 LESSONS_RECORD = os.path.join(RES_FOLDER, "lessons")
 
-PROCESSED_FOLDER = "processed" 
-
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(TEXTS_FOLDER, exist_ok=True)
-os.makedirs(RES_FOLDER, exist_ok=True)
-os.makedirs(LESSONS_RECORD, exist_ok=True)
-os.makedirs(PROCESSED_FOLDER, exist_ok=True) 
+QUESTION_BANK_SUFFIX = ".qbank" # processed/<hash>.qbank, see questionBank.py
+LESSON_CHUNK_SUFFIX = ".idx"    # res/lessons/<hash>/lessonN.idx: bank positions of the lesson's questions
+USERS_FOLDER = "users"          # res/lessons/<hash>/users/<user_id>/: lessons and progress of one user
+USER_ID_PATTERN = re.compile(r'^[A-Za-z0-9_@-][A-Za-z0-9_.@-]{0,63}$')
+REVIEW_DEFAULT_COUNT = 10
+REVIEW_MAX_COUNT = 100
+
+UPLOAD_BLOCK_SIZE = 64 * 1024
+JSON_MIMETYPE = "application/json; charset=utf-8"
+
+# Spawned worker processes (see pdfExtraction.py) import this module again as __mp_main__.
+# They only run extraction tasks, so they skip the folders, stores and generation engine.
+if __name__ != '__mp_main__':
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(TEXTS_FOLDER, exist_ok=True)
+    os.makedirs(MAIN_TEXTS_FOLDER, exist_ok=True)
+    os.makedirs(RES_FOLDER, exist_ok=True)
+    os.makedirs(LESSONS_RECORD, exist_ok=True)
+    os.makedirs(PROCESSED_FOLDER, exist_ok=True) 
+
+    app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+
+    # Resident question generator shared by all requests (see generationEngine.py)
+    generation_engine = GenerationEngine()
+
+    # Subjects, lessons, uploaded files and content hashes. The JSON files above are
+    # only read once, to import existing data when the database is created.
+    metadata_store = MetadataStore(METADATA_DB, legacy_files={
+        "subjects": SUBJECTS_FILE,
+        "lessons": LESSONS_FILE,
+        "files": FILE_RECORD,
+        "text_hashes": TEXT_HASH_RECORD
+    })
 
-app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+    # Answer statistics, keyed by lesson key (see progress_key) and question ID, are appended
+    # to a write-behind log and folded into the metadata store in the background (see statsLog.py)
+    stats_log = StatsLog(
+        STATS_LOG_FILE,
+        lambda lesson_key, updates: apply_stats_updates(lesson_key, updates),
+        after_compact=lambda: save_lesson_metadata()
+    )
+    # Per-lesson progress percentages of every lesson key, kept up to date on every answer (see lessonProgress.py)
+    lesson_progress = LessonProgress(LESSONS_RECORD, lambda lesson_key: load_all_lesson_chunks(lesson_key))
+    # Question ID -> (lesson number, offset) for every lesson key (see questionIndex.py)
+    question_id_index = QuestionIndex(LESSONS_RECORD, lambda lesson_key: load_all_lesson_chunks(lesson_key))
+    # When each answered question is due for review, per lesson key (see reviewScheduler.py)
+    review_scheduler = ReviewScheduler(LESSONS_RECORD, lambda lesson_key: current_question_stats(lesson_key))
+
+# Encoded /get_lesson_questions bodies by lesson key and lesson number, invalidated
+# whenever a lesson file or the key's answer stats change (see responseCache.py)
+lesson_responses = ResponseCache()
+# Held while a document's question bank or lesson files are rewritten
+document_locks = {}
+document_locks_lock = threading.Lock()
+# hash -> bank being built, returned by question_bank() to the thread building it
+staged_banks = {}
 
 def load_uploaded_files():
-    if os.path.exists(FILE_RECORD):
-        with open(FILE_RECORD, "r") as f:
-            return json.load(f)
-    return []
+    return metadata_store.list_files()
 
-def save_uploaded_files(files):
-    with open(FILE_RECORD, "w") as f:
-        json.dump(files, f)
-
-def generate_hash(file_path):
+def save_upload_and_hash(file, file_path):
+    """
+    Writes the uploaded file to disk in fixed-size blocks and hashes each block
+    as it is written, so the upload is never held in memory as a whole.
+    """
     hasher = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        hasher.update(f.read())
+    # One partial file per request: the same file name may be uploaded twice at once
+    partial_path = f"{file_path}.{threading.get_ident()}.part"
+    with open(partial_path, "wb") as out:
+        while True:
+            block = file.stream.read(UPLOAD_BLOCK_SIZE)
+            if not block:
+                break
+            hasher.update(block)
+            out.write(block)
+    os.replace(partial_path, file_path)
     return hasher.hexdigest()
 
+def load_extracted_text_by_hash(hashcode):
+    """Returns the stored texts JSON for content already extracted under `hashcode`, or None."""
+    json_name = metadata_store.get_text_hash(hashcode)
+    if not json_name:
+        return None
+    json_path = os.path.join(TEXTS_FOLDER, json_name)
+    if not os.path.exists(json_path):
+        return None
+    with open(json_path, "r", encoding="utf-8") as f:
+        lesson_data = json.load(f)
+    # The texts JSON is named after the file, so a later upload may have replaced it
+    if lesson_data.get("file_info", {}).get("hashcode") != hashcode:
+        return None
+    return lesson_data
+
 def save_extracted_text(hashcode, filename, main_text, footnotes):
-    json_path = os.path.join(TEXTS_FOLDER, f"{os.path.splitext(filename)[0]}.json")
+    json_path = texts_json_path(filename)
     lesson_data = {
         "file_info": {
             "filename": filename,
@@ -59,79 +141,16 @@ def save_extracted_text(hashcode, filename, main_text, footnotes):
     }
     with open(json_path, "w", encoding="utf-8") as f:
         json.dump(lesson_data, f, indent=4, ensure_ascii=False)
-
-def get_dominant_font_size(pdf_path):
-    font_sizes = []
-    try:
-        with fitz.open(pdf_path) as doc:
-            for page_num, page in enumerate(doc):
-                blocks = page.get_text("dict")["blocks"]
-                if not blocks:
-                    print(f"DEBUG: get_dominant_font_size: Page {page_num + 1} has no text blocks in 'dict' format for {pdf_path}", file=sys.stderr)
-                for block in blocks:
-                    if "lines" in block:
-                        for line in block["lines"]:
-                            for span in line["spans"]:
-                                font_sizes.append(span["size"])
-    except Exception as e:
-        print(f"ERROR: get_dominant_font_size failed for {pdf_path}: {e}", file=sys.stderr)
-        return 10 
-    
-    if font_sizes:
-        most_common_size = Counter(font_sizes).most_common(1)[0][0]
-        return most_common_size
-    print(f"WARNING: get_dominant_font_size: No font sizes found for {pdf_path}. Defaulting to 10.", file=sys.stderr)
-    return 10
-
-def extract_text_by_dynamic_font_size(pdf_path):
-    main_text_parts, footnotes_parts = [], []
-    
-    try:
-        doc = fitz.open(pdf_path)
-        print(f"DEBUG: Successfully opened PDF file: {pdf_path}", file=sys.stderr)
-    except Exception as e:
-        print(f"CRITICAL ERROR: Failed to open PDF file {pdf_path} in extract_text_by_dynamic_font_size: {e}", file=sys.stderr)
-        return "", ""
-
-    try:
-        dominant_font_size = get_dominant_font_size(pdf_path)
-        footnote_threshold = dominant_font_size * 0.9
-    except Exception as e:
-        print(f"WARNING: Could not determine dominant font size for {pdf_path}: {e}. Using default threshold.", file=sys.stderr)
-        dominant_font_size = 10
-        footnote_threshold = 9
-
-    with doc:
-        for page_num, page in enumerate(doc):
-            blocks = page.get_text("dict")["blocks"]
-            for block in blocks:
-                if "lines" in block:
-                    for line in block["lines"]:
-                        for span in line["spans"]:
-                            text = span["text"].strip()
-                            font_size = span["size"]
-                            if text:
-                                if font_size < footnote_threshold and font_size < dominant_font_size:
-                                    footnotes_parts.append(text)
-                                else:
-                                    main_text_parts.append(text)
-    
-    main_text_cleaned = clean_text(" ".join(main_text_parts))
-    footnotes_cleaned = clean_text(" ".join(footnotes_parts))
-
-    if not main_text_cleaned.strip() and not footnotes_cleaned.strip():
-        print(f"ERROR: Standard text extraction returned NO TEXT for {pdf_path}. This PDF may be image-based and requires OCR, which is currently disabled.", file=sys.stderr)
-        raise Exception("No text extracted from PDF via standard method. OCR is disabled.")
+    if main_text:
+        save_main_text(filename, main_text)
     else:
-        print(f"INFO: Standard extraction found main text. Total length: {len(main_text_cleaned)}. First 200 chars:\n---START MAIN TEXT---\n{main_text_cleaned[:200].replace('\n', ' ').strip()}...\n---END MAIN TEXT---", file=sys.stderr)
-    
-    return main_text_cleaned, footnotes_cleaned
+        # A previous upload's pre-encoded text would otherwise still be served
+        try:
+            os.remove(main_text_path(filename))
+        except FileNotFoundError:
+            pass
 
-def clean_text(text):
-    text = re.sub(r'\s+', ' ', text)
-    text = re.sub(r'(\.{2,}|,{2,}|-{2,}|\s{2,})', ' ', text)
-    text = re.sub(r'\[\d+\]|\(\d+\)', '', text)
-    return text.strip()
+    metadata_store.set_text_hash(hashcode, os.path.basename(json_path))
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -143,20 +162,24 @@ def upload_file():
     
     file_path = os.path.join(app.config["UPLOAD_FOLDER"], file.filename)
     try:
-        file.save(file_path)
+        hashcode = save_upload_and_hash(file, file_path)
     except Exception as e:
         return jsonify({'error': f'Failed to save file: {str(e)}'}), 500
     
-    hashcode = generate_hash(file_path)
-    
-    if file.filename not in load_uploaded_files():
-        uploaded_files = load_uploaded_files()
-        uploaded_files.append(file.filename)
-        save_uploaded_files(uploaded_files)
+    metadata_store.add_file(file.filename)
     
     try:
-        main_text, footnotes = extract_text_by_dynamic_font_size(file_path)
-        save_extracted_text(hashcode, file.filename, main_text, footnotes)
+        stored = load_extracted_text_by_hash(hashcode)
+        if stored is not None:
+            # Same content was extracted before: reuse it instead of parsing the PDF again
+            print(f"INFO: Upload {file.filename} matches already extracted content {hashcode}, skipping extraction.", file=sys.stderr)
+            main_text = stored["content"]["main_text"]
+            footnotes = stored["content"]["footnotes"]
+            if stored["file_info"]["filename"] != file.filename:
+                save_extracted_text(hashcode, file.filename, main_text, footnotes)
+        else:
+            main_text, footnotes = extract_text_by_dynamic_font_size(file_path)
+            save_extracted_text(hashcode, file.filename, main_text, footnotes)
     except Exception as e:
         return jsonify({'error': f'Error extracting text: {str(e)}'}), 500
     
@@ -186,48 +209,112 @@ def get_file_content():
     file_name = request.args.get('file')
     if not file_name:
         return jsonify({'error': 'File name is required'}), 400
-    json_path = os.path.join(TEXTS_FOLDER, f"{os.path.splitext(file_name)[0]}.json")
-    if not os.path.exists(json_path):
-        return jsonify({'error': 'Text not found'}), 404
-    with open(json_path, "r", encoding="utf-8") as f:
-        lesson_data = json.load(f)
-    main_text = lesson_data.get("content", {}).get("main_text", "")
-    if not main_text:
-        return jsonify({'error': 'Main text not found'}), 404
-    response = make_response(json.dumps({'main_text': main_text}, ensure_ascii=False))
-    response.headers['Content-Type'] = 'application/json; charset=utf-8'
-    return response
+    path = main_text_path(file_name)
+    if not os.path.exists(path):
+        # Texts extracted before main_text got its own file: split it out once
+        json_path = texts_json_path(file_name)
+        if not os.path.exists(json_path):
+            return jsonify({'error': 'Text not found'}), 404
+        with open(json_path, "r", encoding="utf-8") as f:
+            lesson_data = json.load(f)
+        main_text = lesson_data.get("content", {}).get("main_text", "")
+        if not main_text:
+            return jsonify({'error': 'Main text not found'}), 404
+        save_main_text(file_name, main_text)
+    # Streamed from disk, with ETag/Last-Modified and 304 for conditional requests
+    return send_file(os.path.abspath(path), mimetype=JSON_MIMETYPE, conditional=True, etag=True)
 
 def load_questions(hash_filename):
     path = os.path.join(PROCESSED_FOLDER, hash_filename)
-    if os.path.exists(path):
+    try:
         with open(path, "r", encoding="utf-8") as f:
             return json.load(f)
-    return []
+    except FileNotFoundError:
+        return []
 
-def save_questions_in_lessons(questions, FILE):
-    with open(FILE, "w", encoding="utf-8") as f:
-        json.dump(questions, f, indent=2, ensure_ascii=False)
+def question_bank_path(hash_value):
+    return os.path.join(PROCESSED_FOLDER, hash_value + QUESTION_BANK_SUFFIX)
 
-def load_lessons():
-    if os.path.exists(LESSONS_FILE):
-        with open(LESSONS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
+def question_bank(hash_value):
+    """
+    The document's question bank (see questionBank.py), built from its processed JSON
+    file when there is no bank yet or the JSON file was regenerated. None if neither exists.
+    """
+    if hash_value.endswith('.json'):
+        hash_value = hash_value[:-5]
+    json_path = os.path.join(PROCESSED_FOLDER, hash_value + ".json")
+    bank_path = question_bank_path(hash_value)
+    if question_bank_is_stale(json_path, bank_path):
+        with document_lock(hash_value):
+            if hash_value in staged_banks:
+                return staged_banks[hash_value] # this thread is building it
+            if question_bank_is_stale(json_path, bank_path):
+                build_question_bank(hash_value, bank_path)
+    try:
+        return open_question_bank(bank_path)
+    except FileNotFoundError:
+        return None
 
-def save_lessons(lessons):
-    with open(LESSONS_FILE, "w", encoding="utf-8") as f:
-        json.dump(lessons, f, indent=2, ensure_ascii=False)
+def question_bank_is_stale(json_path, bank_path):
+    try:
+        json_mtime = os.stat(json_path).st_mtime_ns
+    except FileNotFoundError:
+        return False # bank only, or nothing at all
+    try:
+        return os.stat(bank_path).st_mtime_ns < json_mtime
+    except FileNotFoundError:
+        return True
+
+def build_question_bank(hash_value, bank_path):
+    # Lesson chunks of a previous bank, of every user, are kept by question ID
+    old_lesson_ids = {}
+    if os.path.exists(bank_path):
+        old_bank = open_question_bank(bank_path)
+        for lesson_key in document_lesson_keys(hash_value):
+            for lesson_number in list_lesson_numbers(lesson_key):
+                try:
+                    positions = read_positions(lesson_chunk_path(lesson_key, lesson_number))
+                except FileNotFoundError:
+                    continue
+                old_lesson_ids[(lesson_key, lesson_number)] = [old_bank.question_id(p) for p in positions if p < len(old_bank)]
+
+    # Built aside and moved into place only once every lesson file points into it.
+    # Until then the old bank is stale, so readers wait on the document lock.
+    questions = with_question_ids(load_questions(hash_value + ".json"))
+    staged_path = bank_path + ".new"
+    write_question_bank(staged_path, questions)
+    if old_lesson_ids:
+        bank = QuestionBank(staged_path)
+        new_positions = {}
+        for (lesson_key, lesson_number), ids in old_lesson_ids.items():
+            new_positions[(lesson_key, lesson_number)] = [p for p in map(bank.position, ids) if p is not None]
+            write_positions(lesson_chunk_path(lesson_key, lesson_number), new_positions[(lesson_key, lesson_number)])
+        # Every lesson file points into the new bank before the index and progress
+        # are updated, as they may read the other lessons
+        staged_banks[hash_value] = bank
+        try:
+            for (lesson_key, lesson_number), positions in new_positions.items():
+                index_lesson_positions(lesson_key, lesson_number, bank, positions)
+        finally:
+            del staged_banks[hash_value]
+    os.replace(staged_path, bank_path)
+    print(f"[INFO][Flask] Built question bank {bank_path} with {len(questions)} questions", file=sys.stderr)
+    if old_lesson_ids:
+        save_lesson_metadata()
+
+def bank_questions(bank, positions, question_stats):
+    # Questions at bank positions, with their answer statistics
+    questions = bank.questions(p for p in positions if p < len(bank))
+    for q in questions:
+        q['number_of_tries'], q['number_of_correct_tries'] = question_stats.get(q['id'], (0, 0))
+        q['user_difficulty'] = calculate_user_difficulty_score(q)
+    return questions
 
-def load_subjects():
-    if os.path.exists(SUBJECTS_FILE):
-        with open(SUBJECTS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
+def load_lessons():
+    return metadata_store.list_lessons()
 
-def save_subjects(subjects):
-    with open(SUBJECTS_FILE, "w", encoding="utf-8") as f:
-        json.dump(subjects, f, indent=2, ensure_ascii=False)
+def load_subjects():
+    return metadata_store.list_subjects()
 
 @app.route('/get_subjects', methods=['GET'])
 def get_subjects():
@@ -239,10 +326,7 @@ def add_subject():
     subject = data.get("subject")
     if not subject:
         return jsonify({'error': 'Subject name is required'}), 400
-    subjects = load_subjects()
-    if subject not in subjects:
-        subjects.append(subject)
-        save_subjects(subjects)
+    metadata_store.add_subject(subject)
     return jsonify({'message': f'Subject "{subject}" added'}), 200
 
 # Helper function to calculate user difficulty for a single question
@@ -258,6 +342,95 @@ def calculate_user_difficulty_score(question):
     error_rate = 1 - (num_correct_tries / num_tries)
     return error_rate
 
+def with_question_ids(questions):
+    # Questions from files written before IDs existed get their stable ID here
+    for q in questions:
+        if not q.get('id'):
+            q['id'] = question_id(q.get('question', ''), q.get('choices', []))
+    return questions
+
+def document_lock(hash_value):
+    # One lock per document, shared by the lessons of all its users
+    hash_value = split_lesson_key(hash_value)[0]
+    with document_locks_lock:
+        return document_locks.setdefault(hash_value, threading.RLock())
+
+def lesson_key(hash_value, user_id=DEFAULT_USER_ID):
+    """
+    Key of one user's lessons of a document. Requests without a user_id share the
+    document's own lessons (key = hash, files in res/lessons/<hash>/); every other
+    user gets "<hash>/users/<user_id>" (files in res/lessons/<hash>/users/<user_id>/).
+    Their lesson files only hold positions into the shared question bank.
+    The stats log, lesson progress and question index are keyed by it.
+    """
+    if hash_value.endswith('.json'):
+        hash_value = hash_value[:-5]
+    if user_id == DEFAULT_USER_ID:
+        return hash_value
+    return f"{hash_value}/{USERS_FOLDER}/{user_id}"
+
+def split_lesson_key(key):
+    # -> (hash_value, user_id)
+    if key.endswith('.json'):
+        key = key[:-5]
+    hash_value, _, user_id = key.partition(f"/{USERS_FOLDER}/")
+    return hash_value, user_id
+
+def document_lesson_keys(hash_value):
+    users_dir = os.path.join(LESSONS_RECORD, hash_value, USERS_FOLDER)
+    user_ids = sorted(os.listdir(users_dir)) if os.path.isdir(users_dir) else []
+    return [lesson_key(hash_value)] + [lesson_key(hash_value, user_id) for user_id in user_ids]
+
+def request_user_id(source):
+    """user_id of a request (query args or JSON body), DEFAULT_USER_ID if absent. ValueError if malformed."""
+    user_id = source.get('user_id') or DEFAULT_USER_ID
+    if user_id != DEFAULT_USER_ID and not (isinstance(user_id, str) and USER_ID_PATTERN.match(user_id)):
+        raise ValueError(f"Invalid user_id: {user_id!r}")
+    return user_id
+
+def user_lesson_key(hash_value, user_id):
+    """
+    lesson_key() of a user who is about to change their lessons or stats. A user's
+    lessons start from the document's shared lesson0, copied as positions here, on
+    their first answer or when they finalize it. Until then reads go to the shared
+    lesson0 (see lesson_file_key), so requests that only read create no files.
+    """
+    key = lesson_key(hash_value, user_id)
+    if user_id != DEFAULT_USER_ID and not os.path.exists(lesson_chunk_path(key, 0)):
+        with document_lock(hash_value):
+            bank, shared_positions = lesson_bank_positions(lesson_key(hash_value), 0)
+            if shared_positions is not None and bank is not None and not os.path.exists(lesson_chunk_path(key, 0)):
+                os.makedirs(os.path.join(LESSONS_RECORD, key), exist_ok=True)
+                save_lesson_positions(key, 0, bank, shared_positions)
+                save_lesson_metadata()
+    return key
+
+def lesson_file_key(key, lesson_number):
+    # Key whose lesson file holds a lesson: the shared key for lesson0 of a user who has no copy yet
+    hash_value, user_id = split_lesson_key(key)
+    if user_id != DEFAULT_USER_ID and str(lesson_number) == '0' and not os.path.exists(lesson_chunk_path(key, 0)):
+        return lesson_key(hash_value)
+    return key
+
+def lesson_question_stats(key, question_ids=None):
+    # Stored stats of a lesson key, only of `question_ids` if given
+    hash_value, user_id = split_lesson_key(key)
+    return metadata_store.get_question_stats(hash_value, user_id, question_ids)
+
+def current_question_stats(key, question_ids=None):
+    # Stored stats with the answers still waiting in the stats log
+    question_stats = lesson_question_stats(key, question_ids)
+    question_stats.update(stats_log.pending(key))
+    return question_stats
+
+def position_question_ids(bank, positions):
+    return [bank.question_id(p) for p in positions if p < len(bank)]
+
+def save_lesson_metadata():
+    lesson_progress.save_dirty()
+    question_id_index.save_dirty()
+    review_scheduler.save_dirty()
+
 # This is the new function to be called after Lesson 0 completion
 @app.route('/finalize_initial_lesson', methods=['POST'])
 def finalize_initial_lesson():
@@ -266,142 +439,70 @@ def finalize_initial_lesson():
 
     if not hash_value:
         return jsonify({'error': 'Hash value is required'}), 400
+    try:
+        user_id = request_user_id(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    LESSON_DIRECTORY = os.path.join(LESSONS_RECORD, hash_value)
+    # Only this user's lessons are re-organized, from this user's answers
+    key = user_lesson_key(hash_value, user_id)
+    LESSON_DIRECTORY = os.path.join(LESSONS_RECORD, key)
     os.makedirs(LESSON_DIRECTORY, exist_ok=True) # Ensure directory exists
 
-    # Load all questions originally processed
-    all_original_questions = load_questions(hash_value + ".json")
+    # Fold every pending answer into the stats store before the lessons are re-organized
+    stats_log.flush()
 
-    # Load questions specifically from lesson0.json, which have been 'evaluated'
-    lesson0_questions_from_file = load_questions_from_lesson_chunk(hash_value, 0)
-    
-    lesson0_question_texts = {q.get('question') for q in lesson0_questions_from_file if q.get('question')}
-
-    remaining_questions_for_chunks = []
-    for q in all_original_questions:
-        # Re-initialize stats if they are being processed again for a new path
-        q['number_of_tries'] = q.get('number_of_tries', 0)
-        q['number_of_correct_tries'] = q.get('number_of_correct_tries', 0)
-        q['user_difficulty'] = calculate_user_difficulty_score(q) # Calculate user difficulty here
-
-        # Exclude questions that were part of lesson0.json
-        if q.get('question') not in lesson0_question_texts:
-            remaining_questions_for_chunks.append(q)
-
-    # --- New Combined Difficulty Sorting Logic ---
-    for q in remaining_questions_for_chunks:
-        objective_difficulty_percentage = q.get('difficulty_percentage', 50) # 0-100 scale
-        user_difficulty_score = q.get('user_difficulty', 0.5) # 0-1 scale (0=easy for user, 1=hard for user)
-
-        # Normalize objective difficulty to a 0-1 scale for consistent weighting
-        normalized_objective_difficulty = objective_difficulty_percentage / 100.0
-
-        # Define weights based on objective difficulty categories
-        # These weights apply to the *user_difficulty_score* component
-        if objective_difficulty_percentage <= 33: # Easy objective
-            user_weight = 0.125
-        elif 34 <= objective_difficulty_percentage <= 66: # Medium objective
-            user_weight = 0.375
-        else: # Hard objective
-            user_weight = 0.5
-
-        # You need to decide on the overall weighting between objective and user difficulty.
-        # Here, I'm proposing a 50/50 split initially.
-        # This means:
-        # 0.5 * normalized_objective_difficulty (0-1)
-        # + 0.5 * (user_difficulty_score * user_weight * 2)  -- *2 to scale user_weight back to a 0-1 contribution
-        # Let's adjust this to make more sense:
-        # Let's use a "combined_difficulty" score that also ranges from 0-100 (like difficulty_percentage)
-        
-        # Scale user_difficulty_score (0-1) to influence by its weight
-        # A simple way: user_difficulty_score (0-1) * user_weight (e.g., 0.125) gives a tiny value.
-        # Let's think about how to combine them to make sense in a 0-100 scale for sorting.
-        # A higher combined score means harder.
-
-        # Proposed Combination:
-        # User difficulty's influence is based on how "badly" they did on similar questions,
-        # but modulated by the *objective* difficulty category.
-        # A higher `user_difficulty_score` (error rate) means the question was harder for them.
-
-        # Let's aim for a combined score where objective is the baseline, and user performance
-        # shifts it up (if hard for user) or down (if easy for user).
-        
-        # User difficulty contribution: This should be higher if the user struggled (user_difficulty_score is high)
-        # and more so if the question was objectively hard (higher user_weight).
-        user_contribution = user_difficulty_score * user_weight * 100 # Scales to 0-50 effectively if user_weight max is 0.5
-
-        # Combined score: Simple weighted average where user_contribution adds to objective.
-        # Adjust weight_objective and weight_user as needed.
-        weight_objective = 0.5
-        weight_user = 0.5 # This 0.5 is for the *overall* user impact, not the internal user_weight.
-
-        # Let's try a different calculation for combined_difficulty_score (0-100)
-        # combined_difficulty = (objective_difficulty_percentage * overall_objective_weight) + (user_difficulty_score * user_category_weight * some_scaling_factor_to_reach_100)
-        
-        # A more intuitive approach:
-        # Baseline is objective difficulty.
-        # If user_difficulty_score is high (they struggled), increase the effective difficulty.
-        # If user_difficulty_score is low (they found it easy), decrease the effective difficulty.
-        
-        # Let's say user_difficulty_score (0-1, error rate)
-        # If user_difficulty_score is 0.5 (average), no change.
-        # If user_difficulty_score is 1 (always wrong), max increase.
-        # If user_difficulty_score is 0 (always correct), max decrease.
-
-        # `user_influence_factor` ranges from -1 to 1 (easy to hard relative to average performance)
-        user_influence_factor = (user_difficulty_score - 0.5) * 2 # -1 to 1
-
-        # Adjust the user_influence_factor by the user_weight (0.125, 0.375, 0.5)
-        # This means user struggle on hard questions has a bigger impact on score
-        weighted_user_influence = user_influence_factor * user_weight
-
-        # Combine with objective difficulty.
-        # We want this combined score to still be somewhat representative of a 0-100 scale.
-        # Let's say we allow user performance to shift the objective difficulty by up to +/- 20 points
-        # For example, if weighted_user_influence is 0.5, that could be a +10 point shift.
-        max_shift = 20 # Max points user performance can shift the objective difficulty
-
-        # Calculate the actual shift
-        difficulty_shift = weighted_user_influence * max_shift * 2 # Multiply by 2 because weighted_user_influence is roughly -0.5 to 0.5
-
-        combined_difficulty_score = objective_difficulty_percentage + difficulty_shift
-
-        # Ensure the score stays within reasonable bounds (e.g., 0 to 100)
-        combined_difficulty_score = max(0, min(100, combined_difficulty_score))
-
-        q['combined_difficulty_score'] = combined_difficulty_score
-        print(f"DEBUG: Question: '{q.get('question', 'N/A')[:50]}...', Obj Difficulty: {objective_difficulty_percentage:.2f}, User Difficulty Score: {user_difficulty_score:.2f}, Combined Difficulty Score: {combined_difficulty_score:.2f}", file=sys.stderr)
-
-    # Sort the remaining questions by the new combined difficulty score
-    remaining_questions_for_chunks.sort(key=lambda q: q.get('combined_difficulty_score', 0))
-
-    # Re-chunk the remaining questions starting from lesson1.json
+    with document_lock(hash_value):
+        return reorganize_lessons_after_initial_test(key, LESSON_DIRECTORY)
+
+def reorganize_lessons_after_initial_test(key, LESSON_DIRECTORY):
+    # Load all questions originally processed, from the document's question bank
+    hash_value = split_lesson_key(key)[0]
+    bank = question_bank(hash_value)
+    # Stats live in the metadata store by user and question ID, so they survive re-chunking
+    question_stats = lesson_question_stats(key)
+    question_ids = [bank.question_id(position) for position in range(len(bank))] if bank else []
+
+    # Scored for the whole bank at once (see difficultyScoring.py)
+    number_of_tries, number_of_correct_tries = stats_arrays(question_ids, question_stats)
+    scores = combined_difficulty_scores(bank_difficulties(bank) if bank else [], number_of_tries, number_of_correct_tries)
+
+    # Exclude questions that were part of lesson0, then order from easiest to hardest
+    # (by ID: processed files from before deduplication may hold a question twice)
+    lesson0_ids = {question_ids[position] for position in read_lesson_positions(key, 0) or []}
+    remaining_positions = np.array([position for position, question_id in enumerate(question_ids)
+                                    if question_id not in lesson0_ids], dtype=np.intp)
+    ordered_positions = remaining_positions[difficulty_order(scores[remaining_positions])].tolist()
+
+    # Re-chunk the remaining questions starting from lesson1
     questions_per_lesson = 15
-    total_remaining_questions = len(remaining_questions_for_chunks)
-    
-    current_lesson_number = 1 # Start numbering from lesson1.json
+    total_remaining_questions = len(ordered_positions)
+    new_chunks = {
+        lesson_number: ordered_positions[start:start + questions_per_lesson]
+        for lesson_number, start in enumerate(range(0, total_remaining_questions, questions_per_lesson), start=1)
+    }
 
-    # Remove any existing lesson files (lesson1.json, lesson2.json, etc.)
-    # to ensure clean re-generation, but preserve lesson0.json
-    for f_name in os.listdir(LESSON_DIRECTORY):
-        if f_name.startswith('lesson') and f_name.endswith('.json') and f_name != 'lesson0.json':
-            os.remove(os.path.join(LESSON_DIRECTORY, f_name))
-            print(f"Removed old lesson file: {f_name}", file=sys.stderr)
+    # Only chunk files whose positions change are rewritten; lesson0 is preserved
+    existing_positions = {lesson_number: read_lesson_positions(key, lesson_number)
+                          for lesson_number in list_lesson_numbers(key) if lesson_number != 0}
+
+    rewritten = 0
+    for lesson_number, positions in new_chunks.items():
+        if existing_positions.get(lesson_number) == positions:
+            continue
+        save_lesson_positions(key, lesson_number, bank, positions, question_stats)
+        rewritten += 1
 
-    full_chunks_remaining = total_remaining_questions // questions_per_lesson
+    for lesson_number in sorted(set(existing_positions) - set(new_chunks)):
+        f_name = os.path.basename(lesson_chunk_path(key, lesson_number))
+        os.remove(os.path.join(LESSON_DIRECTORY, f_name))
+        lesson_progress.remove_lesson(key, lesson_number)
+        question_id_index.remove_lesson(key, lesson_number)
+        print(f"Removed old lesson file: {f_name}", file=sys.stderr)
 
-    for i in range(full_chunks_remaining):
-        start = i * questions_per_lesson
-        end = start + questions_per_lesson
-        LESSON_FILE_PATH = os.path.join(LESSON_DIRECTORY, f"lesson{current_lesson_number}.json")
-        save_questions_to_lesson_chunk(hash_value, current_lesson_number, remaining_questions_for_chunks[start:end])
-        current_lesson_number += 1
+    print(f"[INFO][Flask] Re-organized {total_remaining_questions} questions into {len(new_chunks)} lessons for {key}, {rewritten} lesson file(s) rewritten", file=sys.stderr)
 
-    leftover = total_remaining_questions % questions_per_lesson
-    if leftover:
-        LESSON_FILE_PATH = os.path.join(LESSON_DIRECTORY, f"lesson{current_lesson_number}.json")
-        save_questions_to_lesson_chunk(hash_value, current_lesson_number, remaining_questions_for_chunks[-leftover:])
+    save_lesson_metadata()
 
     return jsonify({'message': 'Lessons re-organized successfully after initial test.'}), 200
 
@@ -409,13 +510,20 @@ def finalize_initial_lesson():
 def make_lesson_path(hashProcessed):
     LESSON_DIRECTORY = os.path.join(LESSONS_RECORD, hashProcessed)
     os.makedirs(LESSON_DIRECTORY, exist_ok=True)
-    
-    all_questions = load_questions(hashProcessed + ".json")
 
-    for question in all_questions:
-        question['number_of_tries'] = question.get('number_of_tries', 0)
-        question['number_of_correct_tries'] = question.get('number_of_correct_tries', 0)
-        question['user_difficulty'] = question.get('user_difficulty', 0) # Initialize or keep existing
+    # Stats of earlier answers must be in the store before lesson0 is rebuilt from it
+    stats_log.flush()
+
+    with document_lock(hashProcessed):
+        build_lesson_zero(hashProcessed, LESSON_DIRECTORY)
+
+def build_lesson_zero(hashProcessed, LESSON_DIRECTORY):
+    bank = question_bank(hashProcessed)
+    if bank is None:
+        print(f"[ERROR][Flask] No processed questions for {hashProcessed}, lesson0 not created.", file=sys.stderr)
+        return
+    question_stats = metadata_store.get_question_stats(hashProcessed)
+    all_questions = bank_questions(bank, range(len(bank)), question_stats)
 
     # Categorize all questions by difficulty for lesson0 balancing
     easy_questions = []
@@ -460,141 +568,85 @@ def make_lesson_path(hashProcessed):
         lesson_0_questions.append(remaining_pool_for_l0.pop(0))
 
     # Save Lesson 0
-    LESSON_0_FILE_PATH = os.path.join(LESSON_DIRECTORY, "lesson0.json")
-    save_questions_in_lessons(lesson_0_questions, LESSON_0_FILE_PATH)
+    save_questions_to_lesson_chunk(hashProcessed, 0, lesson_0_questions)
+    save_lesson_metadata()
 
     # Initial generation will only create lesson0.
     # The rest will be handled by finalize_initial_lesson later.
 
 
-@app.route('/add_lesson', methods=['POST'])
-def add_lesson():
-    data = request.get_json()
-    required_fields = ["lesson_name", "subject", "date", "difficulty", "text"]
-    if not all(field in data for field in required_fields):
-        return jsonify({'error': 'Missing required lesson fields'}), 400
-
-    processed_filename = None
-
-    def is_json_file_empty(json_path):
-        if not os.path.exists(json_path):
-            return True
-        with open(json_path, "r", encoding="utf-8") as f:
-            try:
-                content = f.read().strip()
-                if not content:
-                    return True
-                data = json.loads(content)
-                return not data if isinstance(data, (list, dict)) else False
-            except json.JSONDecodeError:
-                return True
-        return False
-
-    text_identifier = data['text']
-
-    try:
-        print(f"[INFO][Flask] Attempting to run fireReq.py for {text_identifier}...", file=sys.stderr)
-        result_fire_req = subprocess.run(
-            ['python3', 'fireReqObj.py', text_identifier],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        processed_filename = result_fire_req.stdout.strip()
-        print(f"[INFO][Flask] fireReq.py succeeded with output: {processed_filename}", file=sys.stderr)
-        if result_fire_req.stderr:
-            print(f"\n[DEBUG][Flask] === Stderr from fireReq.py ===\n{result_fire_req.stderr}\n=======================================\n", file=sys.stderr)
-
-        full_path_fire_req = os.path.join(PROCESSED_FOLDER, processed_filename)
-        if is_json_file_empty(full_path_fire_req):
-            print(f"[WARNING][Flask] fireReq.py generated an empty or invalid JSON file ({full_path_fire_req}). Deleting and falling back to huggingReq.py", file=sys.stderr)
-            if os.path.exists(full_path_fire_req):
-                os.remove(full_path_fire_req)
-
-            print(f"[INFO][Flask] Falling back to huggingReq.py for {text_identifier}...", file=sys.stderr)
-            result_hugging_req = subprocess.run(
-                ['python3', 'huggingReq.py', text_identifier],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            processed_filename = result_hugging_req.stdout.strip()
-            print(f"[INFO][Flask] huggingReq.py succeeded with output: {processed_filename}", file=sys.stderr)
-            if result_hugging_req.stderr:
-                print(f"\n[DEBUG][Flask] === Stderr from huggingReq.py ===\n{result_hugging_req.stderr}\n=======================================\n", file=sys.stderr)
-
-            full_path_hugging_req = os.path.join(PROCESSED_FOLDER, processed_filename)
-            if is_json_file_empty(full_path_hugging_req):
-                print("[ERROR] huggingReq.py also returned empty content.", file=sys.stderr)
-                if os.path.exists(full_path_hugging_req):
-                    os.remove(full_path_hugging_req)
-                return jsonify({'error': 'Both generation methods returned empty content.'}), 500
-        
-    except subprocess.CalledProcessError as e:
-        print(f"[ERROR] fireReq.py failed: {e.stderr}", file=sys.stderr)
-        print("[INFO] Falling back to huggingReq.py...", file=sys.stderr)
-
-        try:
-            result_hugging_req = subprocess.run(
-                ['python3', 'huggingReq.py', text_identifier],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            processed_filename = result_hugging_req.stdout.strip()
-            print(f"[INFO] huggingReq.py succeeded with output: {processed_filename}", file=sys.stderr)
-            if result_hugging_req.stderr:
-                print(f"\n[DEBUG][Flask] === Stderr from huggingReq.py ===\n{result_hugging_req.stderr}\n=======================================\n", file=sys.stderr)
-
-            full_path_hugging_req = os.path.join(PROCESSED_FOLDER, processed_filename)
-            if is_json_file_empty(full_path_hugging_req):
-                print("[ERROR] huggingReq.py also returned empty content.", file=sys.stderr)
-                if os.path.exists(full_path_hugging_req):
-                    os.remove(full_path_hugging_req)
-                return jsonify({'error': 'Both generation methods returned empty content.'}), 500
-
-        except subprocess.CalledProcessError as e2:
-            print(f"[ERROR] huggingReq.py also failed: {e2.stderr}", file=sys.stderr)
-            return jsonify({'error': 'Both generation methods failed.'}), 500
-    except Exception as e:
-        print(f"[CRITICAL ERROR] An unexpected error occurred during subprocess execution: {e}", file=sys.stderr)
-        return jsonify({'error': f'Server error during question generation: {str(e)}'}), 500
-
-
+def register_lesson(data, processed_filename):
+    """
+    Records a generated lesson in the metadata store (adding its subject if needed)
+    and builds its lesson0 chunk. Returns the stored lesson entry.
+    """
     if processed_filename and processed_filename.endswith('.json'):
         processed_filename = processed_filename[:-5]
 
-    lessons = load_lessons()
     subject = data['subject']
-    subjects = load_subjects()
-    if subject not in subjects:
-        subjects.append(subject)
-        save_subjects(subjects)
-
-    lessons.append({
+    lesson = {
         'lesson_name': data['lesson_name'],
         'subject': subject,
         'date': data['date'],
         'difficulty': data['difficulty'],
         'text': data['text'],
         'processed filename': processed_filename
-    })
-    save_lessons(lessons)
+    }
+
+    metadata_store.add_subject(subject)
+    metadata_store.add_lesson(lesson)
 
     make_lesson_path(processed_filename) # This will now only create lesson0.json initially
+    return lesson
+
+@app.route('/add_lesson', methods=['POST'])
+def add_lesson():
+    data = request.get_json()
+    required_fields = ["lesson_name", "subject", "date", "difficulty", "text"]
+    if not all(field in data for field in required_fields):
+        return jsonify({'error': 'Missing required lesson fields'}), 400
+
+    text_identifier = data['text']
+    # Job mode: return a job id right away and register the lesson once generation finishes.
+    run_as_job = bool(data.get('async')) or request.args.get('async') in ('1', 'true')
+
+    print(f"[INFO][Flask] Submitting question generation for {text_identifier}...", file=sys.stderr)
+    try:
+        if run_as_job:
+            job = generation_engine.submit(text_identifier, on_complete=lambda job: register_lesson(data, job.processed_filename))
+            return jsonify({
+                'message': f'Lesson \"{data['lesson_name']}\" queued for generation',
+                'job_id': job.job_id,
+                'status': job.status
+            }), 202
+        processed_filename = generation_engine.submit(text_identifier).wait()
+    except queue.Full:
+        return jsonify({'error': 'Too many lessons are being generated, please try again later.'}), 503
+    except GenerationError as e:
+        print(f"[ERROR][Flask] Question generation failed for {text_identifier}: {e}", file=sys.stderr)
+        return jsonify({'error': str(e)}), 500
+
+    lesson = register_lesson(data, processed_filename)
 
     return jsonify({
-        'message': f'Lesson \"{data['lesson_name']}\" added successfully under subject \"{subject}\"',
-        'lesson': {
-            'lesson_name': data['lesson_name'],
-            'subject': subject,
-            'date': data['date'],
-            'difficulty': data['difficulty'],
-            'text': data['text'],
-            'processed filename': processed_filename
-        }
+        'message': f'Lesson \"{data['lesson_name']}\" added successfully under subject \"{lesson['subject']}\"',
+        'lesson': lesson
     }), 201
 
+@app.route('/get_lesson_job', methods=['GET'])
+def get_lesson_job():
+    job_id = request.args.get('job_id')
+    if not job_id:
+        return jsonify({'error': 'Missing job_id parameter'}), 400
+    job = generation_engine.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'job': job.to_dict()}), 200
+
+@app.route('/get_lesson_jobs', methods=['GET'])
+def get_lesson_jobs():
+    return jsonify({'jobs': [job.to_dict() for job in generation_engine.list_jobs()]}), 200
+
 
 @app.route('/get_lessons', methods=['GET'])
 def get_lessons():
@@ -606,9 +658,9 @@ def get_lesson():
     subject = request.args.get('subject')
     if not lesson_name or not subject:
         return jsonify({'error': 'Missing lesson_name or subject parameter'}), 400
-    for lesson in load_lessons():
-        if lesson['lesson_name'] == lesson_name and lesson['subject'] == subject:
-            return jsonify({'lesson hash': lesson['processed filename']}), 200
+    lesson = metadata_store.find_lesson(lesson_name, subject)
+    if lesson:
+        return jsonify({'lesson hash': lesson['processed filename']}), 200
     return jsonify({'error': 'Lesson not found'}), 404
 
 @app.route('/get_lessons_for_hash')
@@ -617,6 +669,11 @@ def get_lessons_for_hash():
     if not hash_value:
         return jsonify({'error': 'Missing hash'}), 400
 
+    try:
+        user_id = request_user_id(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     if hash_value.endswith('.json'):
         hash_value = hash_value[:-5]
 
@@ -625,52 +682,14 @@ def get_lessons_for_hash():
         print(f"[DEBUG] Lesson directory not found: {lesson_dir}", file=sys.stderr)
         return jsonify({'lessons': []})
 
-    lesson_files = sorted([
-        f for f in os.listdir(lesson_dir) if f.startswith('lesson') and f.endswith('.json')
-    ])
-    
-    lessons_with_percentages = []
-
-    for f in lesson_files:
-        try:
-            lesson_number = int(f.replace("lesson", "").replace(".json", ""))
-            
-            lesson_file_path = os.path.join(lesson_dir, f)
-            questions_data = []
-            if os.path.exists(lesson_file_path):
-                with open(lesson_file_path, "r", encoding="utf-8") as lf:
-                    questions_data = json.load(lf)
-
-            sum_of_individual_rates = 0.0
-            number_of_questions_with_attempts = 0
-
-            for q in questions_data:
-                number_of_tries = q.get('number_of_tries', 0)
-                number_of_correct_tries = q.get('number_of_correct_tries', 0)
-
-                if number_of_tries > 0:
-                    sum_of_individual_rates += (number_of_correct_tries / number_of_tries)
-                    number_of_questions_with_attempts += 1
-            
-            average_percentage = 0.0
-            if number_of_questions_with_attempts > 0:
-                average_percentage = (sum_of_individual_rates / number_of_questions_with_attempts) * 100
-            elif questions_data:
-                 average_percentage = 0.0
-
-            lessons_with_percentages.append({
-                'lesson_number': lesson_number,
-                'percentage': average_percentage
-            })
-            
-        except ValueError:
-            print(f"[DEBUG] Could not parse lesson number from file: {f}", file=sys.stderr)
-            continue
-        except Exception as e:
-            print(f"[ERROR] Error processing lesson file {f}: {e}", file=sys.stderr)
-            continue
+    key = lesson_key(hash_value, user_id)
+    if lesson_file_key(key, 0) != key:
+        # A user who has not answered yet only has the shared lesson0
+        shared_lesson = get_lesson_chunk_size(hash_value, 0) is not None
+        return jsonify({'lessons': [{'lesson_number': 0, 'percentage': 0.0}] if shared_lesson else []})
 
-    lessons_with_percentages.sort(key=lambda x: x['lesson_number'])
+    # Answered from the user's per-lesson aggregates, without opening the lesson files
+    lessons_with_percentages = lesson_progress.lesson_percentages(key)
 
     return jsonify({'lessons': lessons_with_percentages})
 
@@ -685,21 +704,51 @@ def get_lesson_questions():
     if not hash_value or lesson_number is None:
         return jsonify({'error': 'Missing parameters'}), 400
 
+    try:
+        user_id = request_user_id(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     if hash_value and hash_value.endswith('.json'):
         hash_value = hash_value[:-5]
         print(f"DEBUG: get_lesson_questions - Cleaned hash: {hash_value}", file=sys.stderr)
 
-    lesson_file = os.path.join(LESSONS_RECORD, hash_value, f"lesson{lesson_number}.json")
-    print(f"DEBUG: get_lesson_questions - Attempting to open file: {lesson_file}", file=sys.stderr)
-
-    if not os.path.exists(lesson_file):
-        print(f"DEBUG: get_lesson_questions - File NOT found: {lesson_file}", file=sys.stderr)
-        return jsonify({'error': 'Lesson file not found'}), 404
-
-    with open(lesson_file, "r", encoding="utf-8") as f:
-        questions = json.load(f)
-
-    return jsonify({'questions': questions})
+    key = lesson_key(hash_value, user_id)
+    stamp = lesson_response_stamp(key, lesson_number)
+    if stamp is None:
+        # No position file: a lesson file from before question banks (converted here) or no lesson at all
+        file_key = lesson_file_key(key, lesson_number)
+        if get_lesson_chunk_size(file_key, lesson_number) is None:
+            print(f"DEBUG: get_lesson_questions - Lesson chunk NOT found: {lesson_chunk_path(file_key, lesson_number)}", file=sys.stderr)
+            return jsonify({'error': 'Lesson file not found'}), 404
+        stamp = lesson_response_stamp(key, lesson_number)
+
+    # Decoded from the memory-mapped question bank, with the user's current answer stats,
+    # and encoded once until the lesson or the user's stats change
+    body = lesson_responses.body(key, lesson_number, stamp, lambda: app.json.dumps(
+        {'questions': load_questions_from_lesson_chunk(key, lesson_number)}).encode("utf-8"))
+    return app.response_class(body, mimetype=JSON_MIMETYPE)
+
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def lesson_response_stamp(key, lesson_number):
+    # Files a cached lesson response was built from; None if the lesson has no position file.
+    # question_bank() first rebuilds the bank if its processed file was regenerated.
+    file_key = lesson_file_key(key, lesson_number)
+    chunk_stamp = file_stamp(lesson_chunk_path(file_key, lesson_number))
+    if chunk_stamp is None:
+        return None
+    hash_value = split_lesson_key(key)[0]
+    if question_bank(hash_value) is None:
+        return None
+    # A response read from the shared lesson0 is also dropped when that is rewritten
+    shared_version = lesson_responses.version(file_key) if file_key != key else None
+    return file_stamp(question_bank_path(hash_value)), chunk_stamp, shared_version
 
 @app.route('/update_lesson', methods=['POST'])
 def update_lesson():
@@ -710,48 +759,161 @@ def update_lesson():
     difficulty = data.get('difficulty')
     if not all([lesson_name, subject, date, difficulty]):
         return jsonify({'error': 'Missing required fields'}), 400
-    lessons = load_lessons()
-    updated = False
-    for lesson in lessons:
-        if lesson['lesson_name'] == lesson_name and lesson['subject'] == subject:
-            lesson['date'] = date
-            lesson['difficulty'] = difficulty
-            updated = True
-            break
-    if not updated:
+    if not metadata_store.update_lesson(lesson_name, subject, date, difficulty):
         return jsonify({'error': 'Lesson not found'}), 404
-    save_lessons(lessons)
     return jsonify({'message': 'Lesson updated successfully'}), 200
 
 @app.route('/get_processed_file/<hashcode>', methods=['GET'])
 def get_processed_file(hashcode):
     filepath = os.path.join(PROCESSED_FOLDER, hashcode + ".json")
     if not os.path.exists(filepath):
-        return jsonify({'error': 'File not found'}), 404
+        # Only the question bank is left: export it as JSON
+        bank = question_bank(hashcode)
+        if bank is None:
+            return jsonify({'error': 'File not found'}), 404
+        return jsonify(bank.questions())
     try:
-        with open(filepath, 'r', encoding="utf-8") as file:
-            data = json.load(file)
-        return jsonify(data), 200
+        # The file is already the JSON response: stream it without parsing it,
+        # with ETag/Last-Modified and 304 for conditional requests
+        return send_file(os.path.abspath(filepath), mimetype=JSON_MIMETYPE, conditional=True, etag=True)
     except Exception as e:
         return jsonify({'error': f'Failed to read file: {str(e)}'}), 500
 
-def load_questions_from_lesson_chunk(hash_value, lesson_number):
-    if hash_value.endswith('.json'):
-        hash_value = hash_value[:-5]
-    lesson_file_path = os.path.join(LESSONS_RECORD, hash_value, f"lesson{lesson_number}.json")
-    if os.path.exists(lesson_file_path):
-        with open(lesson_file_path, 'r', encoding="utf-8") as f:
-            return json.load(f)
-    print(f"[ERROR][Flask] Lesson chunk file not found: {lesson_file_path}", file=sys.stderr)
-    return []
+def lesson_chunk_path(key, lesson_number):
+    return os.path.join(LESSONS_RECORD, key, f"lesson{lesson_number}{LESSON_CHUNK_SUFFIX}")
 
-def save_questions_to_lesson_chunk(hash_value, lesson_number, questions_data):
-    if hash_value.endswith('.json'):
-        hash_value = hash_value[:-5]
-    lesson_file_path = os.path.join(LESSONS_RECORD, hash_value, f"lesson{lesson_number}.json")
-    with open(lesson_file_path, 'w', encoding="utf-8") as f:
-        json.dump(questions_data, f, indent=4, ensure_ascii=False)
-    print(f"[INFO][Flask] Saved updated questions to lesson chunk file: {lesson_file_path}", file=sys.stderr)
+def list_lesson_numbers(key):
+    # Lesson chunks of a lesson key: position files, and JSON chunk files from before question banks
+    lesson_dir = os.path.join(LESSONS_RECORD, key)
+    lesson_numbers = set()
+    if not os.path.exists(lesson_dir):
+        return []
+    for f in os.listdir(lesson_dir):
+        for suffix in (LESSON_CHUNK_SUFFIX, '.json'):
+            if f.startswith('lesson') and f.endswith(suffix):
+                try:
+                    lesson_numbers.add(int(f[len('lesson'):-len(suffix)]))
+                except ValueError:
+                    print(f"[DEBUG] Could not parse lesson number from file: {f}", file=sys.stderr)
+    return sorted(lesson_numbers)
+
+def read_lesson_positions(key, lesson_number):
+    """Bank positions of a lesson chunk's questions, None if the lesson does not exist."""
+    if key.endswith('.json'):
+        key = key[:-5]
+    try:
+        return read_positions(lesson_chunk_path(key, lesson_number))
+    except FileNotFoundError:
+        pass
+    legacy_path = os.path.join(LESSONS_RECORD, key, f"lesson{lesson_number}.json")
+    if not os.path.exists(legacy_path):
+        return None
+    with document_lock(key):
+        return migrate_legacy_lesson_chunk(key, lesson_number, legacy_path)
+
+def migrate_legacy_lesson_chunk(key, lesson_number, legacy_path):
+    # Lesson file with full question copies: its stats move into the store, the questions become bank positions
+    try:
+        return read_positions(lesson_chunk_path(key, lesson_number)) # converted meanwhile
+    except FileNotFoundError:
+        pass
+    hash_value, user_id = split_lesson_key(key)
+    with open(legacy_path, "r", encoding="utf-8") as f:
+        questions = with_question_ids(json.load(f))
+    metadata_store.set_question_stats(hash_value, {
+        q['id']: (q['number_of_tries'], q.get('number_of_correct_tries', 0))
+        for q in questions if q.get('number_of_tries', 0) > 0
+    }, overwrite=False, user_id=user_id)
+    bank = question_bank(hash_value)
+    positions = [p for p in (bank.position(q['id']) for q in questions) if p is not None] if bank else []
+    write_positions(lesson_chunk_path(key, lesson_number), positions)
+    os.replace(legacy_path, legacy_path + ".bak")
+    lesson_responses.invalidate(key)
+    print(f"[INFO][Flask] Converted {legacy_path} to bank positions ({len(positions)} of {len(questions)} questions found in the bank)", file=sys.stderr)
+    return positions
+
+def lesson_bank_positions(key, lesson_number):
+    """
+    (bank, positions) of a lesson chunk, from the same bank build: a bank rebuild
+    rewrites the positions, so if the bank changed while they were read, both are
+    read again under the document lock.
+    """
+    hash_value = split_lesson_key(key)[0]
+    bank = question_bank(hash_value)
+    positions = read_lesson_positions(key, lesson_number)
+    if question_bank(hash_value) is not bank:
+        with document_lock(hash_value):
+            bank = question_bank(hash_value)
+            positions = read_lesson_positions(key, lesson_number)
+    return bank, positions
+
+def read_lesson_chunk_file(key, lesson_number, question_stats=None):
+    # Questions of a lesson chunk with their stored stats, without answers still waiting in the stats log
+    if key.endswith('.json'):
+        key = key[:-5]
+    bank, positions = lesson_bank_positions(lesson_file_key(key, lesson_number), lesson_number)
+    if positions is None or bank is None:
+        print(f"[ERROR][Flask] Lesson chunk not found: {lesson_chunk_path(key, lesson_number)}", file=sys.stderr)
+        return []
+    if question_stats is None:
+        question_stats = lesson_question_stats(key, position_question_ids(bank, positions))
+    return bank_questions(bank, positions, question_stats)
+
+def load_questions_from_lesson_chunk(key, lesson_number, question_stats=None):
+    questions = read_lesson_chunk_file(key, lesson_number, question_stats)
+    for changed_index in stats_log.apply_pending(key, questions):
+        questions[changed_index]['user_difficulty'] = calculate_user_difficulty_score(questions[changed_index])
+    return questions
+
+def load_all_lesson_chunks(key):
+    # {lesson_number: questions} for every chunk file of a lesson key
+    lesson_numbers = list_lesson_numbers(key)
+    for lesson_number in lesson_numbers:
+        read_lesson_positions(key, lesson_number) # converts lesson files from before question banks, seeding the stats store
+    question_stats = lesson_question_stats(key)
+    return {lesson_number: load_questions_from_lesson_chunk(key, lesson_number, question_stats)
+            for lesson_number in lesson_numbers}
+
+def get_lesson_chunk_size(key, lesson_number):
+    """Number of questions in a lesson chunk. None if missing."""
+    positions = read_lesson_positions(key, lesson_number)
+    return None if positions is None else len(positions)
+
+def question_id_at(key, lesson_number, offset):
+    bank, positions = lesson_bank_positions(key, lesson_number)
+    return bank.question_id(positions[offset])
+
+def apply_stats_updates(key, updates):
+    # Called by the stats log compactor with {question_id: (tries, correct)} for one lesson key.
+    # Lesson chunks only hold bank positions, so the stats store is all there is to update.
+    # Readers already saw these answers as pending, so cached lesson responses stay valid.
+    hash_value, user_id = split_lesson_key(key)
+    metadata_store.set_question_stats(hash_value, updates, user_id=user_id)
+
+def save_lesson_positions(key, lesson_number, bank, positions, question_stats=None):
+    if key.endswith('.json'):
+        key = key[:-5]
+    lesson_file_path = lesson_chunk_path(key, lesson_number)
+    write_positions(lesson_file_path, positions)
+    print(f"[INFO][Flask] Saved lesson chunk file: {lesson_file_path}", file=sys.stderr)
+    index_lesson_positions(key, lesson_number, bank, positions, question_stats)
+
+def index_lesson_positions(key, lesson_number, bank, positions, question_stats=None):
+    # Brings the question index and lesson progress up to date with a written lesson chunk
+    if question_stats is None:
+        question_stats = lesson_question_stats(key, position_question_ids(bank, positions))
+    questions = bank_questions(bank, positions, question_stats)
+    # Answers not compacted into the store yet count too
+    stats_log.apply_pending(key, questions)
+    question_id_index.set_lesson(key, lesson_number, questions)
+    lesson_progress.rebuild_lesson(key, lesson_number, questions)
+    lesson_responses.invalidate(key)
+
+def save_questions_to_lesson_chunk(key, lesson_number, questions_data):
+    # Stored as the questions' positions in the document's question bank
+    bank = question_bank(split_lesson_key(key)[0])
+    positions = [p for p in (bank.position(q['id']) for q in questions_data) if p is not None]
+    save_lesson_positions(key, lesson_number, bank, positions)
 
 
 @app.route('/update_question_stats', methods=['POST'])
@@ -762,42 +924,96 @@ def update_question_stats():
         return jsonify({'error': 'Request body must be JSON'}), 400
 
     hash_value = data.get('hash')
+    # A question is addressed by its stable ID, or by its position in a lesson chunk
+    answered_id = data.get('question_id')
     lesson_number = data.get('lesson_number')
     question_index = data.get('question_index')
     number_of_tries = data.get('number_of_tries')
     number_of_correct_tries = data.get('number_of_correct_tries')
 
-    if not all([hash_value, lesson_number is not None, question_index is not None,
+    if not all([hash_value, answered_id or (lesson_number is not None and question_index is not None),
                 number_of_tries is not None, number_of_correct_tries is not None]):
         return jsonify({'error': 'Missing required fields for update'}), 400
+    try:
+        user_id = request_user_id(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     try:
-        lesson_questions = load_questions_from_lesson_chunk(hash_value, lesson_number)
-
-        if not lesson_questions:
-            return jsonify({'error': 'Lesson chunk file not found or empty'}), 404
-
-        if 0 <= question_index < len(lesson_questions):
-            question_to_update = lesson_questions[question_index]
-            
-            question_to_update['number_of_tries'] = number_of_tries
-            question_to_update['number_of_correct_tries'] = number_of_correct_tries
-            
-            # Recalculate user_difficulty for this specific question when its stats are updated
-            question_to_update['user_difficulty'] = calculate_user_difficulty_score(question_to_update)
-
-            save_questions_to_lesson_chunk(hash_value, lesson_number, lesson_questions)
-            
-            print(f"[INFO][Flask] Updated stats for question {question_index} in lesson {lesson_number} (hash: {hash_value}): Tries={number_of_tries}, Correct={number_of_correct_tries}, User Difficulty Score (Recalc)={question_to_update['user_difficulty']:.2f}", file=sys.stderr)
-            return jsonify({'message': 'Question stats updated successfully'}), 200
+        key = user_lesson_key(hash_value, user_id)
+        if answered_id:
+            location = question_id_index.locate(key, answered_id)
+            if location is None:
+                print(f"[ERROR][Flask] /update_question_stats: Unknown question_id: {answered_id} (hash: {key})", file=sys.stderr)
+                return jsonify({'error': 'Unknown question id for this document'}), 404
+            lesson_number, question_index = location
         else:
-            print(f"[ERROR][Flask] /update_question_stats: Invalid question_index: {question_index} for lesson {lesson_number} (hash: {hash_value})", file=sys.stderr)
-            return jsonify({'error': 'Invalid question index for this lesson'}), 404
+            chunk_size = get_lesson_chunk_size(key, lesson_number)
+
+            if not chunk_size:
+                return jsonify({'error': 'Lesson chunk file not found or empty'}), 404
+
+            if not 0 <= question_index < chunk_size:
+                print(f"[ERROR][Flask] /update_question_stats: Invalid question_index: {question_index} for lesson {lesson_number} (hash: {key})", file=sys.stderr)
+                return jsonify({'error': 'Invalid question index for this lesson'}), 404
+            answered_id = question_id_at(key, lesson_number, question_index)
+
+        # Scheduled first: a schedule built on first use from the stored stats must not
+        # already contain this answer, or it would not count as a new one
+        review_scheduler.record_answer(key, answered_id, number_of_tries, number_of_correct_tries)
+        # Appended to the stats log; the compactor writes it into the user's stats later
+        stats_log.record(key, answered_id, number_of_tries, number_of_correct_tries)
+        lesson_responses.invalidate(key)
+        lesson_progress.record_answer(key, lesson_number, question_index, number_of_tries, number_of_correct_tries)
+        return jsonify({'message': 'Question stats updated successfully'}), 200
 
     except Exception as e:
         print(f"[CRITICAL ERROR][Flask] /update_question_stats: Error updating question stats: {e}", file=sys.stderr)
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
 
+@app.route('/get_review_questions', methods=['GET'])
+def get_review_questions():
+    hash_value = request.args.get('hash')
+    if not hash_value:
+        return jsonify({'error': 'Missing hash'}), 400
+    try:
+        user_id = request_user_id(request.args)
+        count = int(request.args.get('count', REVIEW_DEFAULT_COUNT))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    count = max(1, min(count, REVIEW_MAX_COUNT))
+
+    if hash_value.endswith('.json'):
+        hash_value = hash_value[:-5]
+    bank = question_bank(hash_value)
+    if bank is None:
+        return jsonify({'error': 'File not found'}), 404
+    key = lesson_key(hash_value, user_id)
+    if lesson_file_key(key, 0) != key:
+        return jsonify({'questions': []}) # has not answered anything yet
+
+    # The questions due soonest in the user's review schedule, overdue first
+    while True:
+        reviews = []
+        missing_ids = []
+        for review_id, due in review_scheduler.next_reviews(key, count):
+            position = bank.position(review_id)
+            if position is None:
+                missing_ids.append(review_id) # dropped when the document was regenerated
+            else:
+                reviews.append((position, due))
+        if not missing_ids:
+            break
+        for review_id in missing_ids:
+            review_scheduler.forget(key, review_id)
+
+    review_positions = [position for position, _ in reviews]
+    questions = bank_questions(bank, review_positions, current_question_stats(key, position_question_ids(bank, review_positions)))
+    for q, (_, due) in zip(questions, reviews):
+        q['due_at'] = due
+    return jsonify({'questions': questions})
+
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,124 @@
+import os
+import sys
+import threading
+from chunkDispatcher import dispatch_chunks, get_rate_limiter
+from questionCache import question_cache
+from textChunker import (MODEL_CONTEXT_TOKENS, DEFAULT_CONTEXT_TOKENS, PROMPT_OVERHEAD_TOKENS,
+                         estimate_tokens, questions_for_chunk)
+
+# Up to LLM_BATCH_MAX_CHUNKS chunks are packed into one request as labeled sections.
+# 1 sends every chunk on its own.
+LLM_BATCH_MAX_CHUNKS = int(os.environ.get("LLM_BATCH_MAX_CHUNKS", "4"))
+# Output a batched request may ask for; the batch also has to fit the context window
+BATCH_MAX_OUTPUT_TOKENS = int(os.environ.get("BATCH_MAX_OUTPUT_TOKENS", "8192"))
+TOKENS_PER_QUESTION = 150    # one question object in the JSON answer
+SECTION_OVERHEAD_TOKENS = 10 # "[SECTION n]" label and separators
+
+
+def batch_output_tokens(texts):
+    return sum(questions_for_chunk(text) for text in texts) * TOKENS_PER_QUESTION + 50
+
+
+def plan_batches(texts, model_name, max_chunks=LLM_BATCH_MAX_CHUNKS):
+    """
+    Groups consecutive chunk indices into batches of at most max_chunks chunks whose
+    sections, prompt and expected answer fit the model's context window and the
+    output budget.
+    """
+    context = MODEL_CONTEXT_TOKENS.get(model_name, DEFAULT_CONTEXT_TOKENS)
+    batches = []
+    current = []
+    input_tokens = PROMPT_OVERHEAD_TOKENS
+    output_tokens = 50
+    for index, text in enumerate(texts):
+        text_tokens = estimate_tokens(text) + SECTION_OVERHEAD_TOKENS
+        text_output = questions_for_chunk(text) * TOKENS_PER_QUESTION
+        fits = (len(current) < max_chunks
+                and output_tokens + text_output <= BATCH_MAX_OUTPUT_TOKENS
+                and input_tokens + text_tokens + output_tokens + text_output <= context)
+        if current and not fits:
+            batches.append(current)
+            current, input_tokens, output_tokens = [], PROMPT_OVERHEAD_TOKENS, 50
+        current.append(index)
+        input_tokens += text_tokens
+        output_tokens += text_output
+    if current:
+        batches.append(current)
+    return batches
+
+
+def dispatch_batched(parts, llm_fn, llm_batch_fn, model, prompt_version, schema, provider,
+                     max_chunks=LLM_BATCH_MAX_CHUNKS, progress=None, finish_chunk=None):
+    """
+    Like dispatch_chunks() over cached_llm(llm_fn, ...), but chunks that are not cached
+    yet are packed into batched requests: llm_batch_fn(texts) returns one question list
+    per text. A section that comes back empty is retried on its own with llm_fn(text).
+    Every request, retries included, waits for the `provider` rate limiter.
+    Results are cached per chunk and returned in chunk order.
+    `progress`, if given, is called as progress(chunks_done, chunks_total, questions_so_far).
+    `finish_chunk`, if given, is called as finish_chunk(text, questions) once a chunk's
+    questions are known (cached chunks included) and returns its final questions, e.g.
+    from a fallback provider when this one returned none. Only this model's own
+    answers are cached.
+    """
+    limiter = get_rate_limiter(provider) if provider else None
+    results = [[] for _ in parts]
+    missing = []
+    for index, part in enumerate(parts):
+        cached = question_cache.get(part, model, prompt_version)
+        if cached is not None:
+            try:
+                results[index] = [schema.model_validate(q) for q in cached]
+                if finish_chunk:
+                    results[index] = finish_chunk(part, results[index]) or []
+                continue
+            except Exception as e:
+                print(f"[WARNING][Batcher] Cached questions no longer validate, regenerating: {e}", file=sys.stderr)
+        missing.append(index)
+
+    lock = threading.Lock()
+    chunks_done = len(parts) - len(missing)
+    questions_so_far = sum(len(r) for r in results)
+    if progress and chunks_done:
+        progress(chunks_done, len(parts), questions_so_far)
+
+    batches = plan_batches([parts[index] for index in missing], model, max_chunks)
+    batches = [[missing[i] for i in batch] for batch in batches]
+    if len(batches) < len(missing):
+        print(f"[INFO][Batcher] Sending {len(missing)} chunks in {len(batches)} batched requests for {model}", file=sys.stderr)
+
+    def retry_alone(text):
+        # The batch took the rate limiter slot; a retry is a request of its own
+        if limiter:
+            limiter.acquire()
+        return llm_fn(text)
+
+    def run_batch(batch):
+        nonlocal chunks_done, questions_so_far
+        if len(batch) == 1:
+            answers = [llm_fn(parts[batch[0]])]
+        else:
+            try:
+                answers = list(llm_batch_fn([parts[index] for index in batch]))
+            except Exception as e:
+                print(f"[ERROR][Batcher] Batched request for {len(batch)} chunks failed, retrying them one by one: {e}", file=sys.stderr)
+                answers = []
+            answers += [[]] * (len(batch) - len(answers))
+        for index, questions in zip(batch, answers):
+            if not questions and len(batch) > 1:
+                print(f"[WARNING][Batcher] Section for chunk {index + 1} came back empty, retrying it alone.", file=sys.stderr)
+                questions = retry_alone(parts[index])
+            if questions:
+                question_cache.put(parts[index], model, prompt_version, [q.model_dump() for q in questions])
+            if finish_chunk:
+                questions = finish_chunk(parts[index], questions or [])
+            results[index] = questions or []
+        with lock:
+            chunks_done += len(batch)
+            questions_so_far += sum(len(results[index]) for index in batch)
+            if progress:
+                progress(chunks_done, len(parts), questions_so_far)
+        return []
+
+    dispatch_chunks(batches, run_batch, provider)
+    return results
@@ -0,0 +1,87 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Maximum number of chunks of one document that are sent to the LLM at the same time.
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "4"))
+
+# Requests per second allowed for each provider (shared by every document being
+# generated in this process). 0 disables the limit. Override with e.g. FW_RATE_LIMIT=2.
+DEFAULT_RATE_LIMITS = {
+    "FW": 5.0,
+    "HF": 2.0,
+}
+
+
+class RateLimiter:
+    """
+    Spaces out request starts so that no more than `rate_per_second` begin per second.
+    Threads reserve the next free slot under the lock and sleep outside of it.
+    """
+
+    def __init__(self, rate_per_second):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider):
+    with _rate_limiters_lock:
+        if provider not in _rate_limiters:
+            rate = float(os.environ.get(f"{provider}_RATE_LIMIT", DEFAULT_RATE_LIMITS.get(provider, 0)))
+            _rate_limiters[provider] = RateLimiter(rate)
+        return _rate_limiters[provider]
+
+
+def dispatch_chunks(parts, chunk_fn, provider, max_concurrency=LLM_MAX_CONCURRENCY, progress=None):
+    """
+    Calls chunk_fn(part) for every text part on a bounded thread pool and returns
+    the per-chunk question lists in chunk order, so callers can merge them exactly
+    as the sequential loop did. A chunk that raises counts as an empty chunk.
+    `provider` selects the rate limiter; pass None when chunk_fn rate-limits its own calls.
+    `progress`, if given, is called as progress(chunks_done, chunks_total, questions_so_far).
+    """
+    if not parts:
+        return []
+
+    limiter = get_rate_limiter(provider) if provider else None
+    results = [[] for _ in parts]
+
+    def run_chunk(part):
+        if limiter:
+            limiter.acquire()
+        return chunk_fn(part)
+
+    chunks_done = 0
+    questions_so_far = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(parts))), thread_name_prefix=f"{provider or 'llm'}-chunk") as pool:
+        futures = {pool.submit(run_chunk, part): index for index, part in enumerate(parts)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result() or []
+            except Exception as e:
+                print(f"[ERROR][Dispatcher] Chunk {index + 1}/{len(parts)} failed for provider {provider}: {e}", file=sys.stderr)
+            chunks_done += 1
+            questions_so_far += len(results[index])
+            if progress:
+                progress(chunks_done, len(parts), questions_so_far)
+
+    return results
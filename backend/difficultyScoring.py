@@ -0,0 +1,53 @@
+import os
+import numpy as np
+from questionBank import NO_DIFFICULTY
+
+# Combined difficulty = objective difficulty (0-100) shifted by how the user did on the
+# question. The shift is weighted by the question's objective difficulty band, so
+# struggling on a hard question moves it more than struggling on an easy one.
+EASY_MAX_DIFFICULTY = 33   # difficulty_percentage <= 33 is the easy band
+MEDIUM_MAX_DIFFICULTY = 66 # 34-66 medium, above hard
+# User weight of the easy, medium and hard bands
+DIFFICULTY_BAND_WEIGHTS = tuple(float(w) for w in os.environ.get("DIFFICULTY_BAND_WEIGHTS", "0.125,0.375,0.5").split(","))
+# Points a user's performance can shift the objective difficulty at a band weight of 0.5
+DIFFICULTY_MAX_SHIFT = float(os.environ.get("DIFFICULTY_MAX_SHIFT", "20"))
+DEFAULT_DIFFICULTY = 50 # questions generated without a difficulty_percentage
+
+
+def bank_difficulties(bank):
+    """difficulty_percentage of every question in a QuestionBank, as a float array."""
+    packed = np.frombuffer(bank.difficulties, dtype=np.uint8)
+    return np.where(packed == NO_DIFFICULTY, DEFAULT_DIFFICULTY, packed).astype(np.float64)
+
+
+def stats_arrays(question_ids, question_stats):
+    """(tries, correct) arrays aligned with question_ids, from {question_id: (tries, correct)}."""
+    stats = np.array([question_stats.get(question_id, (0, 0)) for question_id in question_ids], dtype=np.float64).reshape(-1, 2)
+    return stats[:, 0], stats[:, 1]
+
+
+def user_difficulties(tries, correct):
+    """Error rate per question (0 = always right, 1 = always wrong), 0.5 for unanswered questions."""
+    tries = np.asarray(tries, dtype=np.float64)
+    correct = np.asarray(correct, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(tries > 0, 1 - correct / tries, 0.5)
+
+
+def combined_difficulty_scores(difficulty, tries, correct, band_weights=DIFFICULTY_BAND_WEIGHTS, max_shift=DIFFICULTY_MAX_SHIFT):
+    """
+    combined_difficulty_score (0-100) for every question at once. `difficulty` has one
+    value per question; tries/correct may carry leading dimensions (e.g. one row per
+    student) and are broadcast against it.
+    """
+    difficulty = np.asarray(difficulty, dtype=np.float64)
+    bands = (difficulty > EASY_MAX_DIFFICULTY).astype(np.intp) + (difficulty > MEDIUM_MAX_DIFFICULTY)
+    user_weight = np.asarray(band_weights, dtype=np.float64)[bands]
+    # -1 (always right) .. 1 (always wrong), 0 for an average or unanswered question
+    user_influence = (user_difficulties(tries, correct) - 0.5) * 2
+    return np.clip(difficulty + user_influence * user_weight * max_shift * 2, 0, 100)
+
+
+def difficulty_order(scores):
+    """Indices that sort scores from easiest to hardest, ties kept in bank order (along the last axis)."""
+    return np.argsort(scores, axis=-1, kind='stable')
@@ -1,12 +1,12 @@
 import json
 import os
 import sys
-import requests
 import hashlib
 from pydantic import BaseModel, Field
 from typing import List
 import openai
 from getToken import receiveToken
+from textStore import get_materials
 
 #the key is in a sepparate script  under gitignore
 FIREWORKS_API_KEY = receiveToken("FW")
@@ -59,15 +59,6 @@ Text:
         print(f"Failed to get or parse completion: {e}", file=sys.stderr)
         return []
 
-def getMaterials(filename):
-    url = f"http://127.0.0.1:5000/get_file_content?file={filename}"
-    response = requests.get(url)
-    if response.status_code == 200:
-        text = response.text
-        return text, len(text.split())
-    else:
-        raise Exception(f"Failed to get file content: {response.status_code} {response.text}")
-
 def split_text_by_word_count(text, max_words=1000):
     words = text.split()
     return [" ".join(words[i:i + max_words]) for i in range(0, len(words), max_words)]
@@ -81,7 +72,7 @@ if __name__ == "__main__":
     input_filename = sys.argv[1]
 
     try:
-        text, _ = getMaterials(input_filename)
+        text, _ = get_materials(input_filename)
         parts = split_text_by_word_count(text, max_words=1000)
 
         all_questions = []
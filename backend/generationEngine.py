@@ -0,0 +1,187 @@
+import json
+import os
+import queue
+import sys
+import threading
+import uuid
+import providerRouter
+from processedStore import PROCESSED_FOLDER
+
+GENERATION_WORKERS = int(os.environ.get("GENERATION_WORKERS", "2"))
+# Maximum number of jobs waiting for a worker; submit() raises queue.Full beyond this.
+GENERATION_QUEUE_SIZE = int(os.environ.get("GENERATION_QUEUE_SIZE", "100"))
+# Finished jobs kept around so clients can still read their final status.
+MAX_FINISHED_JOBS = 500
+
+
+class GenerationError(Exception):
+    pass
+
+
+def is_json_file_empty(json_path):
+    if not os.path.exists(json_path):
+        return True
+    with open(json_path, "r", encoding="utf-8") as f:
+        try:
+            content = f.read().strip()
+            if not content:
+                return True
+            data = json.loads(content)
+            return not data if isinstance(data, (list, dict)) else False
+        except json.JSONDecodeError:
+            return True
+
+
+class GenerationJob:
+    def __init__(self, text_identifier, on_complete=None):
+        self.job_id = uuid.uuid4().hex
+        self.text_identifier = text_identifier
+        self.status = "queued"
+        self.provider = None
+        self.chunks_done = 0
+        self.chunks_total = 0
+        self.questions_generated = 0
+        self.chunk_providers = {}
+        self.processed_filename = None
+        self.error = None
+        self.result = None
+        # Called from the worker thread once generation succeeded; its return
+        # value is stored in job.result. The job only counts as done after it ran.
+        self.on_complete = on_complete
+        self._done = threading.Event()
+
+    def update_progress(self, chunks_done, chunks_total, questions_so_far, providers=None):
+        self.chunks_done = chunks_done
+        self.chunks_total = chunks_total
+        self.questions_generated = questions_so_far
+        if providers is not None:
+            self.chunk_providers = providers
+
+    def is_finished(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the job has finished and returns the processed filename.
+        Raises GenerationError if every provider failed.
+        """
+        if not self._done.wait(timeout):
+            raise GenerationError(f"Question generation for {self.text_identifier} timed out.")
+        if self.error:
+            raise GenerationError(self.error)
+        return self.processed_filename
+
+    def to_dict(self):
+        processed_hash = self.processed_filename
+        if processed_hash and processed_hash.endswith('.json'):
+            processed_hash = processed_hash[:-5]
+        return {
+            'job_id': self.job_id,
+            'text': self.text_identifier,
+            'status': self.status,
+            'provider': self.provider,
+            'chunk_providers': self.chunk_providers,
+            'chunks_done': self.chunks_done,
+            'chunks_total': self.chunks_total,
+            'questions_generated': self.questions_generated,
+            'processed_hash': processed_hash,
+            'error': self.error,
+            'result': self.result
+        }
+
+
+class GenerationEngine:
+    """
+    Resident question generation pool. Jobs are put on an in-process queue and
+    picked up by long-lived worker threads, which call providerRouter
+    directly instead of starting a new interpreter for every lesson.
+    The number of workers bounds how fast queued uploads are drained.
+    """
+
+    def __init__(self, num_workers=GENERATION_WORKERS, queue_size=GENERATION_QUEUE_SIZE):
+        self.num_workers = max(1, num_workers)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._jobs = {}
+        self._jobs_lock = threading.Lock()
+        self._workers = []
+        self._start_lock = threading.Lock()
+
+    def submit(self, text_identifier, on_complete=None):
+        self._ensure_started()
+        job = GenerationJob(text_identifier, on_complete=on_complete)
+        with self._jobs_lock:
+            self._forget_finished_jobs()
+            self._jobs[job.job_id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._jobs_lock:
+                del self._jobs[job.job_id]
+            raise
+        print(f"[INFO][Engine] Queued job {job.job_id} for {text_identifier} ({self._queue.qsize()} waiting)", file=sys.stderr)
+        return job
+
+    def get_job(self, job_id):
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self):
+        with self._jobs_lock:
+            return list(self._jobs.values())
+
+    def _forget_finished_jobs(self):
+        # Caller holds _jobs_lock. Jobs are kept in submission order, so the oldest finished go first.
+        finished = [job_id for job_id, job in self._jobs.items() if job.is_finished()]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._workers:
+                return
+            for i in range(self.num_workers):
+                worker = threading.Thread(target=self._worker_loop, name=f"generation-worker-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _worker_loop(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            except Exception as e:
+                print(f"[CRITICAL ERROR][Engine] Unexpected error in job {job.job_id}: {e}", file=sys.stderr)
+                job.status = "failed"
+                job.error = f"Server error during question generation: {str(e)}"
+            finally:
+                job._done.set()
+                self._queue.task_done()
+
+    def _run(self, job):
+        job.status = "running"
+        # providerRouter falls back from Fireworks to Hugging Face per chunk
+        job.provider = providerRouter.__name__
+        print(f"[INFO][Engine] Running {job.provider} for {job.text_identifier}...", file=sys.stderr)
+        try:
+            processed_filename = providerRouter.generate_processed_file(job.text_identifier, progress=job.update_progress)
+        except Exception as e:
+            print(f"[ERROR][Engine] {job.provider} failed for {job.text_identifier}: {e}", file=sys.stderr)
+            job.status = "failed"
+            job.error = "All generation providers failed."
+            return
+
+        full_path = os.path.join(PROCESSED_FOLDER, processed_filename)
+        if is_json_file_empty(full_path):
+            print(f"[WARNING][Engine] {job.provider} generated an empty or invalid JSON file ({full_path}). Deleting it.", file=sys.stderr)
+            if os.path.exists(full_path):
+                os.remove(full_path)
+            job.status = "failed"
+            job.error = "All generation providers returned empty content."
+            return
+
+        print(f"[INFO][Engine] {job.provider} succeeded with output: {processed_filename}", file=sys.stderr)
+        job.processed_filename = processed_filename
+        if job.on_complete:
+            job.status = "finalizing"
+            job.result = job.on_complete(job)
+        job.status = "done"
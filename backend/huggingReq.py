@@ -1,6 +1,5 @@
 import json
 import os
-import requests
 import sys
 import hashlib
 import re
@@ -8,6 +7,7 @@ from huggingface_hub import InferenceClient
 from getToken import receiveToken
 from pydantic import BaseModel, Field, ValidationError
 from typing import List
+from textStore import get_materials
 
 # --- Pydantic Schemas ---pip 
 class Question(BaseModel):
@@ -113,19 +113,6 @@ Text:
         print(f"[ERROR] Failed to get completion from LLM in huggingReq.py: {e}", file=sys.stderr)
         return []
 
-# --- getMaterials Function ---
-def getMaterials(filename):
-    url = f"http://127.0.0.1:5000/get_file_content?file={filename}"
-    try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        text = response.text
-        return text, len(text.split())
-    except requests.exceptions.Timeout:
-        raise Exception(f"Failed to get file content (timeout): Request timed out after 30 seconds for {url}")
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Failed to get file content (request error) from {url}: {e}")
-
 # --- split_text_by_word_count Function ---
 def split_text_by_word_count(text, max_words=1000):
     words = text.split()
@@ -140,7 +127,7 @@ if __name__ == "__main__":
     input_filename = sys.argv[1]
 
     try:
-        text, _ = getMaterials(input_filename)
+        text, _ = get_materials(input_filename)
         if not text.strip():
             print(f"[CRITICAL ERROR] Retrieved empty text content for filename: '{input_filename}'. Cannot generate questions. Exiting.", file=sys.stderr)
             sys.exit(1)
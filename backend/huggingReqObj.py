@@ -1,52 +1,38 @@
 import json
 import os
 import sys
-import requests
-import hashlib
 import re
-import random  # Import random module
-from collections import defaultdict # Import defaultdict for tracking indices
 from huggingface_hub import InferenceClient
 from getToken import receiveToken
-from pydantic import BaseModel, Field, ValidationError
+from chunkDispatcher import dispatch_chunks
+from questionCache import cached_llm
+from pydantic import ValidationError
+from questionSchemas import ParsedQuestion
 from typing import List
-
-# --- Pydantic Schemas ---
-
-# Temporary schema for parsing LLM output BEFORE randomization
-# We expect the LLM to still put the conceptual correct answer at index 0 initially
-class ParsedQuestion(BaseModel):
-    question: str
-    choices: List[str] = Field(..., min_items=4, max_items=4)
-    # The LLM will be prompted to put the correct answer at index 0.
-    # This field will store that initial index (which should be 0).
-    correct_answer: int = Field(..., ge=0, le=3)
-    difficulty_percentage: int = Field(..., ge=0, le=100) # Added difficulty
-
-class ParsedQuestionList(BaseModel):
-    questions: List[ParsedQuestion]
-
-# Final schema for the output JSON after randomization
-class Question(BaseModel):
-    question: str
-    choices: List[str] = Field(..., min_items=4, max_items=4)
-    correct_answer: int = Field(..., ge=0, le=3)
-    difficulty_percentage: int = Field(..., ge=0, le=100) # Added difficulty
-
-class FinalQuestionList(BaseModel): # Renamed to avoid conflict if QuestionList is used elsewhere
-    questions: List[Question]
+from textStore import get_materials
+from textChunker import chunk_text, chunk_token_budget, questions_for_chunk
+from jsonStream import JsonArrayItemStream
+from processedStore import write_processed_file
 
 # --- Initialize Hugging Face client ---
+# This module is also imported by the in-process provider router, so a missing
+# token must not terminate the interpreter; llm() reports the missing client instead.
 client = None
 try:
     hf_token = receiveToken("HF")
     if not hf_token:
-        print("[CRITICAL ERROR] Hugging Face API token is empty or invalid. Please check getToken.py. Exiting.", file=sys.stderr)
-        sys.exit(1)
-    client = InferenceClient(api_key=hf_token)
+        print("[CRITICAL ERROR] Hugging Face API token is empty or invalid. Please check getToken.py.", file=sys.stderr)
+    else:
+        client = InferenceClient(api_key=hf_token)
 except Exception as e:
-    print(f"[CRITICAL ERROR] Failed to initialize Hugging Face client: {e}. Ensure API key is correct and network is stable. Exiting.", file=sys.stderr)
-    sys.exit(1)
+    print(f"[CRITICAL ERROR] Failed to initialize Hugging Face client: {e}. Ensure API key is correct and network is stable.", file=sys.stderr)
+
+MODEL_NAME = "meta-llama/Llama-3.1-8B-Instruct"
+# Bump whenever the prompt or output schema changes, so cached questions from
+# the old prompt are not reused (see questionCache.py).
+PROMPT_VERSION = "hf-obj-2"
+# Stream the completion and validate each question as soon as its JSON object is complete
+HF_STREAMING = os.environ.get("HF_STREAMING", "1") == "1"
 
 # --- JSON Parsing Helper ---
 def try_parse_json_block(text) -> List[dict]:
@@ -87,13 +73,15 @@ def try_parse_json_block(text) -> List[dict]:
         return []
 
 # --- LLM Function ---
-def llm(text) -> List[ParsedQuestion]:
+def llm(text, num_questions=None) -> List[ParsedQuestion]:
     """
     Calls the Hugging Face LLM to generate questions and parses the raw text output
-    into ParsedQuestion objects.
+    into ParsedQuestion objects. The number of questions follows the chunk length unless given.
     """
+    if num_questions is None:
+        num_questions = questions_for_chunk(text)
     user_prompt = f"""
-You are a question generator. Given a source text, generate 10 multiple-choice questions in strict JSON format.
+You are a question generator. Given a source text, generate {num_questions} multiple-choice questions in strict JSON format.
 
 Each question must be an object like:
 {{
@@ -116,8 +104,11 @@ Text:
             print("[ERROR] Hugging Face InferenceClient is not initialized. Cannot make LLM call.", file=sys.stderr)
             return []
 
+        if HF_STREAMING:
+            return llm_streaming(user_prompt)
+
         completion = client.chat.completions.create(
-            model="meta-llama/Llama-3.1-8B-Instruct",
+            model=MODEL_NAME,
             messages=[{"role": "user", "content": user_prompt}],
             max_tokens=2048,
             temperature=0.1,
@@ -126,20 +117,10 @@ Text:
         print(f"[DEBUG] Raw LLM content (from huggingReq.py):\n{content}", file=sys.stderr)
 
         # Parse raw content into a list of dictionaries
-        question_dicts = try_parse_json_block(content)
+        question_dicts = JsonArrayItemStream().feed(content) or try_parse_json_block(content)
 
         # Validate each dictionary against the ParsedQuestion schema
-        parsed_questions = []
-        for q_dict in question_dicts:
-            try:
-                parsed_questions.append(ParsedQuestion.model_validate(q_dict))
-            except ValidationError as e:
-                print(f"[ERROR] Pydantic validation error for a question dictionary: {e}", file=sys.stderr)
-                print(f"[ERROR] Invalid question dict: {q_dict}", file=sys.stderr)
-                # Skip this invalid question and continue with others
-            except Exception as e:
-                print(f"[ERROR] Unexpected error validating question dict: {e}", file=sys.sys.stderr)
-                print(f"[ERROR] Problematic dict: {q_dict}", file=sys.stderr)
+        parsed_questions = [q for q in map(validate_question_dict, question_dicts) if q is not None]
 
         if not parsed_questions:
             print(f"[DEBUG] No valid ParsedQuestion objects created from raw content. Raw content was:\n{content}", file=sys.stderr)
@@ -149,95 +130,78 @@ Text:
         print(f"[ERROR] Failed to get completion from LLM in huggingReq.py: {e}", file=sys.stderr)
         return []
 
-def randomize_correct_answer_indices(questions: List[ParsedQuestion]) -> List[Question]:
+def validate_question_dict(q_dict):
+    """Returns the ParsedQuestion for one question dictionary, or None if it is invalid."""
+    try:
+        return ParsedQuestion.model_validate(q_dict)
+    except ValidationError as e:
+        print(f"[ERROR] Pydantic validation error for a question dictionary: {e}", file=sys.stderr)
+        print(f"[ERROR] Invalid question dict: {q_dict}", file=sys.stderr)
+    except Exception as e:
+        print(f"[ERROR] Unexpected error validating question dict: {e}", file=sys.stderr)
+        print(f"[ERROR] Problematic dict: {q_dict}", file=sys.stderr)
+    return None
+
+def llm_streaming(user_prompt) -> List[ParsedQuestion]:
     """
-    Randomizes the correct_answer index (0-3) for each question,
-    ensuring no more than 4 questions have the same correct_answer index.
-    The original correct answer text (which was at index 0 from LLM) is moved to the new random index.
+    Streams the completion and validates every question object as soon as it is
+    complete. If the stream breaks off (max_tokens, dropped connection), the
+    questions finished before that are kept.
     """
-    final_questions = []
-    # Tracks how many times each index (0, 1, 2, 3) has been assigned as correct
-    index_counts = defaultdict(int)
-    max_count_per_index = 4 # Constraint: no more than 4 questions with the same index
-
-    for i, pq in enumerate(questions):
-        # Ensure choices list has at least 4 elements before proceeding
-        if len(pq.choices) < 4:
-            print(f"Warning: Question {i+1} has less than 4 choices. Skipping randomization for this question.", file=sys.stderr)
-            # If choices are insufficient, just use the original question as is,
-            # or handle as an error. For now, we'll just append it with original values.
-            final_questions.append(
-                Question(
-                    question=pq.question,
-                    choices=pq.choices,
-                    correct_answer=pq.correct_answer, # This would still be 0 as per ParsedQuestion
-                    difficulty_percentage=pq.difficulty_percentage
-                )
-            )
-            continue # Move to the next question
-
-        original_correct_text = pq.choices[0] # Assume LLM put correct answer at index 0
-
-        # Create a list of valid indices for this specific question
-        # An index is valid if its count is less than max_count_per_index
-        valid_indices = [
-            idx for idx in range(4) if index_counts[idx] < max_count_per_index
-        ]
-
-        if not valid_indices:
-            # Fallback if all indices are capped. This means we cannot satisfy the constraint.
-            # In this scenario, pick the index with the minimum current count to minimize deviation.
-            min_val = min(index_counts.values())
-            valid_indices = [idx for idx, count in index_counts.items() if count == min_val]
-            # If still no valid indices (e.g., all counts are equal and maxed out, which shouldn't happen with 4 options and max_count_per_index=4)
-            if not valid_indices:
-                valid_indices = [0] # Default to 0 if all else fails
-            print(f"Warning: Exhausted valid indices for question {i+1}. Re-using min-count index: {valid_indices[0]}", file=sys.stderr)
-
-
-        new_correct_index = random.choice(valid_indices)
-
-        # Update choices list:
-        # 1. Store the choice at new_correct_index (which is now a distractor)
-        # 2. Place the original_correct_text at new_correct_index
-        # 3. Place the stored distractor at original_correct_index (which was 0)
-        new_choices = list(pq.choices) # Create a mutable copy
-        if new_correct_index != 0:
-            distractor_at_new_index = new_choices[new_correct_index]
-            new_choices[new_correct_index] = original_correct_text
-            new_choices[0] = distractor_at_new_index
-        # If new_correct_index is 0, no swap is needed as it's already there
-
-        index_counts[new_correct_index] += 1
-
-        final_questions.append(
-            Question(
-                question=pq.question,
-                choices=new_choices,
-                correct_answer=new_correct_index,
-                difficulty_percentage=pq.difficulty_percentage
-            )
+    parser = JsonArrayItemStream()
+    parsed_questions = []
+    try:
+        stream = client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=[{"role": "user", "content": user_prompt}],
+            max_tokens=2048,
+            temperature=0.1,
+            stream=True,
         )
-    return final_questions
+        for event in stream:
+            if not event.choices:
+                continue
+            delta = event.choices[0].delta.content
+            if not delta:
+                continue
+            for q_dict in parser.feed(delta):
+                question = validate_question_dict(q_dict)
+                if question is not None:
+                    parsed_questions.append(question)
+    except Exception as e:
+        print(f"[ERROR] LLM stream failed after {len(parsed_questions)} question(s) in huggingReqObj.py: {e}", file=sys.stderr)
 
+    if parser.incomplete:
+        print(f"[WARNING] LLM output was cut off; keeping the {len(parsed_questions)} complete question(s).", file=sys.stderr)
+    if not parsed_questions:
+        print("[DEBUG] No valid ParsedQuestion objects created from the streamed content.", file=sys.stderr)
+    return parsed_questions
 
-# --- getMaterials Function ---
-def getMaterials(filename):
-    url = f"http://127.0.0.1:5000/get_file_content?file={filename}"
-    try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        text = response.text
-        return text, len(text.split())
-    except requests.exceptions.Timeout:
-        raise Exception(f"Failed to get file content (timeout): Request timed out after 30 seconds for {url}")
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Failed to get file content (request error) from {url}: {e}")
+def generate_processed_file(input_filename, progress=None):
+    """
+    Generates the questions for `input_filename`, writes them to processed/
+    and returns the output filename (e.g. "1a2b3c4d.json").
+    `progress`, if given, is called as progress(chunks_done, chunks_total, questions_so_far)
+    after every chunk.
+    """
+    text, _ = get_materials(input_filename)
+    if not text.strip():
+        raise Exception(f"Retrieved empty text content for filename: '{input_filename}'. Cannot generate questions.")
+
+    # Sentence-aware chunks sized for the model's context (see textChunker.py)
+    parts = chunk_text(text, chunk_token_budget(MODEL_NAME))
+    all_parsed_questions: List[ParsedQuestion] = [] # List to hold ParsedQuestion objects
+
+    # Chunks are sent concurrently (cached chunks skip the LLM); results come back in chunk order
+    chunk_results = dispatch_chunks(parts, cached_llm(llm, MODEL_NAME, PROMPT_VERSION, ParsedQuestion), "HF", progress=progress)
+    for part, parsed_questions_from_llm in zip(parts, chunk_results):
+        # llm now returns ParsedQuestion objects directly
+        if parsed_questions_from_llm:
+            all_parsed_questions.extend(parsed_questions_from_llm)
+        else:
+            print(f"[DEBUG] llm(part) returned no ParsedQuestion objects for a text part. Part (first 100 chars): {part[:100]}...", file=sys.stderr)
 
-# --- split_text_by_word_count Function ---
-def split_text_by_word_count(text, max_words=1000):
-    words = text.split()
-    return [" ".join(words[i:i + max_words]) for i in range(0, len(words), max_words)]
+    return write_processed_file(input_filename, all_parsed_questions)
 
 # --- Main Entry Point ---
 if __name__ == "__main__":
@@ -245,41 +209,14 @@ if __name__ == "__main__":
         print("Usage: python huggingReq.py <filename>", file=sys.stderr)
         sys.exit(1)
 
+    if client is None:
+        sys.exit(1)
+
     input_filename = sys.argv[1]
 
     try:
-        text, _ = getMaterials(input_filename)
-        if not text.strip():
-            print(f"[CRITICAL ERROR] Retrieved empty text content for filename: '{input_filename}'. Cannot generate questions. Exiting.", file=sys.stderr)
-            sys.exit(1)
-
-        parts = split_text_by_word_count(text, max_words=1000)
-        all_parsed_questions: List[ParsedQuestion] = [] # List to hold ParsedQuestion objects
-
-        for part in parts:
-            # llm now returns ParsedQuestion objects directly
-            parsed_questions_from_llm = llm(part)
-            if parsed_questions_from_llm:
-                all_parsed_questions.extend(parsed_questions_from_llm)
-            else:
-                print(f"[DEBUG] llm(part) returned no ParsedQuestion objects for a text part. Part (first 100 chars): {part[:100]}...", file=sys.stderr)
-
-        # Randomize correct answer indices after all questions are generated and parsed
-        final_questions_for_output = randomize_correct_answer_indices(all_parsed_questions)
-
-        os.makedirs("processed", exist_ok=True)
-        hash_digest = hashlib.sha256(input_filename.encode()).hexdigest()[:8]
-        output_filename = f"{hash_digest}.json"
-        output_path = os.path.join("processed", output_filename)
-
-        with open(output_path, "w", encoding="utf-8") as f:
-            if not final_questions_for_output: # Check the final list
-                print(f"[WARNING] No questions generated in total for {output_path}. Writing empty array to file.", file=sys.stderr)
-            # Dump the final list of Question objects
-            json.dump([q.model_dump() for q in final_questions_for_output], f, ensure_ascii=False, indent=4)
-
-        print(output_filename)
+        print(generate_processed_file(input_filename))
 
     except Exception as e:
         print(f"[CRITICAL ERROR] Main script execution failed: {e}", file=sys.stderr)
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
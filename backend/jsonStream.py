@@ -0,0 +1,59 @@
+import json
+import sys
+
+
+class JsonArrayItemStream:
+    """
+    Incremental parser for LLM output that contains a JSON array of objects, either
+    bare (`[{...}, ...]`) or under a key (`{"questions": [{...}, ...]}`), possibly
+    surrounded by prose or code fences. feed() takes the next piece of text and
+    returns every array element object that was completed by it, so items can be
+    used while the completion is still streaming, and the complete items survive a
+    completion cut off by max_tokens.
+    """
+
+    def __init__(self):
+        self._stack = []   # open containers, '{' or '['
+        self._in_string = False
+        self._escape = False
+        self._item = None  # characters of the element object being collected
+        self._item_depth = 0
+
+    def feed(self, text):
+        items = []
+        for ch in text:
+            if self._item is not None:
+                self._item.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if not self._stack and ch not in '{[':
+                continue # prose around the JSON
+            if ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                if ch == '{' and self._stack and self._stack[-1] == '[' and self._item is None:
+                    self._item = ['{']
+                    self._item_depth = len(self._stack)
+                self._stack.append(ch)
+            elif ch in '}]':
+                if self._stack:
+                    self._stack.pop()
+                if self._item is not None and len(self._stack) == self._item_depth:
+                    item_text = ''.join(self._item)
+                    self._item = None
+                    try:
+                        items.append(json.loads(item_text))
+                    except ValueError as e:
+                        print(f"[WARNING][JsonStream] Skipping malformed array item: {e}. Item: {item_text[:200]}...", file=sys.stderr)
+        return items
+
+    @property
+    def incomplete(self):
+        """True if the text fed so far stops inside the JSON (e.g. cut off by max_tokens)."""
+        return bool(self._stack)
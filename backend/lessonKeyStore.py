@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+
+
+class LessonKeyStore(ABC):
+    """
+    Base of the state kept in memory for every lesson key (see app.lesson_key) and
+    persisted to <lessons_root>/<key>/<FILENAME>: lesson progress, the question index
+    and the review schedule. A key's document is loaded on first use, from its file
+    or, if there is none yet, built by _build(); save_dirty() writes the keys changed
+    since the last call.
+
+    Subclasses set FILENAME and implement _build(key), _from_file(data) and
+    _to_file(document). Methods that change a document add its key to _dirty.
+    Building a document calls back into app code that takes the per-document locks,
+    while the app calls these stores with a document lock held. So documents are
+    loaded outside _lock: get the document with _document() first, then take _lock
+    to read or change it.
+    """
+
+    FILENAME = None
+
+    def __init__(self, lessons_root):
+        self.lessons_root = lessons_root
+        self._lock = threading.RLock()
+        self._documents = {} # key -> document
+        self._dirty = set()
+        # Held over a whole save_dirty() call, so an older snapshot of a key is never
+        # written over a newer one. Taken before _lock, never while holding it.
+        self._save_lock = threading.Lock()
+
+    @staticmethod
+    def _key(key):
+        return key[:-5] if key.endswith('.json') else key
+
+    def _path(self, key):
+        return os.path.join(self.lessons_root, key, self.FILENAME)
+
+    def _document(self, key):
+        # Caller must not hold _lock (see the class docstring)
+        with self._lock:
+            document = self._documents.get(key)
+        if document is not None:
+            return document
+        path = self._path(key)
+        built = not os.path.exists(path)
+        if built:
+            document = self._build(key)
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                document = self._from_file(json.load(f))
+        with self._lock:
+            # Another thread may have loaded the key meanwhile; its copy already
+            # carries every change made since, so it wins
+            if key not in self._documents:
+                self._prepare(document)
+                self._documents[key] = document
+                if built:
+                    self._dirty.add(key)
+            return self._documents[key]
+
+    @abstractmethod
+    def _build(self, key):
+        """Document of a key that has no file yet."""
+
+    @abstractmethod
+    def _from_file(self, data):
+        """Document from the parsed JSON of its file."""
+
+    @abstractmethod
+    def _to_file(self, document):
+        """JSON-serializable form of a document, read back by _from_file()."""
+
+    def _prepare(self, document):
+        """Called under _lock when a loaded document is installed."""
+
+    def save_dirty(self):
+        # Called from request threads and from the stats compactor
+        with self._save_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+                snapshots = {key: json.dumps(self._to_file(self._documents[key]))
+                             for key in dirty if key in self._documents}
+            for key, data in snapshots.items():
+                path = self._path(key)
+                if not os.path.isdir(os.path.dirname(path)):
+                    continue
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
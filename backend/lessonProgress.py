@@ -0,0 +1,104 @@
+import sys
+from lessonKeyStore import LessonKeyStore
+
+PROGRESS_FILENAME = "progress.json"
+
+
+def new_lesson_aggregate():
+    return {'question_count': 0, 'sum_of_rates': 0.0, 'questions_with_attempts': 0, 'rates': {}}
+
+
+class LessonProgress(LessonKeyStore):
+    """
+    Per-lesson progress aggregates for every document hash: how many questions a
+    lesson has, how many of them were attempted and the sum of their correct rates.
+    Answers update them incrementally, so the lesson overview is O(lessons) and
+    never opens the question files. Aggregates are persisted to
+    <lessons_root>/<hash>/progress.json by save_dirty().
+    """
+
+    FILENAME = PROGRESS_FILENAME
+
+    def __init__(self, lessons_root, load_chunks_fn):
+        # load_chunks_fn(hash_value) -> {lesson_number: questions}; only used to build
+        # the aggregates of a document that has no progress file yet.
+        super().__init__(lessons_root)
+        self.load_chunks_fn = load_chunks_fn
+
+    def _build(self, hash_value):
+        document = {}
+        for lesson_number, questions in self.load_chunks_fn(hash_value).items():
+            document[lesson_number] = self._aggregate(questions)
+        print(f"[INFO][Progress] Built lesson progress for {hash_value} from its lesson files", file=sys.stderr)
+        return document
+
+    @staticmethod
+    def _from_file(stored):
+        document = {}
+        for lesson_number, aggregate in stored.items():
+            aggregate['rates'] = {int(index): rate for index, rate in aggregate['rates'].items()}
+            document[int(lesson_number)] = aggregate
+        return document
+
+    @staticmethod
+    def _to_file(document):
+        return document
+
+    @staticmethod
+    def _aggregate(questions):
+        aggregate = new_lesson_aggregate()
+        aggregate['question_count'] = len(questions)
+        for index, q in enumerate(questions):
+            number_of_tries = q.get('number_of_tries', 0)
+            if number_of_tries > 0:
+                rate = q.get('number_of_correct_tries', 0) / number_of_tries
+                aggregate['rates'][index] = rate
+                aggregate['sum_of_rates'] += rate
+                aggregate['questions_with_attempts'] += 1
+        return aggregate
+
+    def rebuild_lesson(self, hash_value, lesson_number, questions):
+        """Recomputes one lesson from its full question list (called whenever a chunk file is written)."""
+        hash_value = self._key(hash_value)
+        document = self._document(hash_value)
+        with self._lock:
+            document[int(lesson_number)] = self._aggregate(questions)
+            self._dirty.add(hash_value)
+
+    def remove_lesson(self, hash_value, lesson_number):
+        hash_value = self._key(hash_value)
+        document = self._document(hash_value)
+        with self._lock:
+            document.pop(int(lesson_number), None)
+            self._dirty.add(hash_value)
+
+    def record_answer(self, hash_value, lesson_number, question_index, number_of_tries, number_of_correct_tries):
+        """O(1) update of a lesson aggregate with the new stats of one question."""
+        hash_value = self._key(hash_value)
+        document = self._document(hash_value)
+        with self._lock:
+            aggregate = document.setdefault(int(lesson_number), new_lesson_aggregate())
+            old_rate = aggregate['rates'].pop(question_index, None)
+            if old_rate is not None:
+                aggregate['sum_of_rates'] -= old_rate
+                aggregate['questions_with_attempts'] -= 1
+            if number_of_tries > 0:
+                rate = number_of_correct_tries / number_of_tries
+                aggregate['rates'][question_index] = rate
+                aggregate['sum_of_rates'] += rate
+                aggregate['questions_with_attempts'] += 1
+            self._dirty.add(hash_value)
+
+    def lesson_percentages(self, hash_value):
+        """Returns [{'lesson_number', 'percentage'}] sorted by lesson number."""
+        hash_value = self._key(hash_value)
+        document = self._document(hash_value)
+        with self._lock:
+            lessons = []
+            for lesson_number in sorted(document):
+                aggregate = document[lesson_number]
+                average_percentage = 0.0
+                if aggregate['questions_with_attempts'] > 0:
+                    average_percentage = (aggregate['sum_of_rates'] / aggregate['questions_with_attempts']) * 100
+                lessons.append({'lesson_number': lesson_number, 'percentage': average_percentage})
+            return lessons
@@ -0,0 +1,187 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subjects (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS lessons (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    lesson_name TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    date TEXT,
+    difficulty,
+    text TEXT,
+    processed_filename TEXT
+);
+CREATE INDEX IF NOT EXISTS lessons_by_name_subject ON lessons (lesson_name, subject);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS text_hashes (
+    hashcode TEXT PRIMARY KEY,
+    json_name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_question_stats (
+    hash TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    question_id TEXT NOT NULL,
+    number_of_tries INTEGER NOT NULL,
+    number_of_correct_tries INTEGER NOT NULL,
+    PRIMARY KEY (hash, user_id, question_id)
+) WITHOUT ROWID;
+"""
+
+# Answers that were recorded without a user (and everything from before per-user stats)
+DEFAULT_USER_ID = ""
+# Question IDs bound per query when stats are looked up for given questions
+# (SQLite builds before 3.32 allow at most 999 parameters)
+STATS_QUERY_BATCH = 500
+
+
+def lesson_row_to_dict(row):
+    # Same shape as the entries lessons.json used to hold
+    return {
+        'lesson_name': row['lesson_name'],
+        'subject': row['subject'],
+        'date': row['date'],
+        'difficulty': row['difficulty'],
+        'text': row['text'],
+        'processed filename': row['processed_filename']
+    }
+
+
+class MetadataStore:
+    """
+    SQLite (WAL mode) store for subjects, lessons, uploaded files and content hashes.
+    Every write touches a single row and lookups go through indexes, instead of
+    reading and rewriting the whole JSON files on each request.
+    Each thread gets its own connection.
+    """
+
+    def __init__(self, db_path, legacy_files=None):
+        self.db_path = db_path
+        self._local = threading.local()
+        is_new = not os.path.exists(db_path)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        if is_new and legacy_files:
+            self._import_legacy_json(legacy_files)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _import_legacy_json(self, legacy_files):
+        """One-time import of lessons.json / subjects.json / files.json / text_hashes.json."""
+        def read_json(key, default):
+            path = legacy_files.get(key)
+            if path and os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            return default
+
+        for subject in read_json("subjects", []):
+            self.add_subject(subject)
+        for lesson in read_json("lessons", []):
+            self.add_lesson(lesson)
+        for filename in read_json("files", []):
+            self.add_file(filename)
+        for hashcode, json_name in read_json("text_hashes", {}).items():
+            self.set_text_hash(hashcode, json_name)
+        print(f"[INFO][Store] Imported legacy JSON metadata into {self.db_path}", file=sys.stderr)
+
+    # --- Subjects ---
+    def list_subjects(self):
+        return [row['name'] for row in self._connect().execute("SELECT name FROM subjects ORDER BY id")]
+
+    def add_subject(self, name):
+        """Returns True if the subject was not stored yet."""
+        with self._connect() as conn:
+            return conn.execute("INSERT OR IGNORE INTO subjects (name) VALUES (?)", (name,)).rowcount == 1
+
+    # --- Lessons ---
+    def list_lessons(self):
+        return [lesson_row_to_dict(row) for row in self._connect().execute("SELECT * FROM lessons ORDER BY id")]
+
+    def find_lesson(self, lesson_name, subject):
+        row = self._connect().execute(
+            "SELECT * FROM lessons WHERE lesson_name = ? AND subject = ? ORDER BY id LIMIT 1",
+            (lesson_name, subject)
+        ).fetchone()
+        return lesson_row_to_dict(row) if row else None
+
+    def add_lesson(self, lesson):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO lessons (lesson_name, subject, date, difficulty, text, processed_filename) VALUES (?, ?, ?, ?, ?, ?)",
+                (lesson['lesson_name'], lesson['subject'], lesson.get('date'), lesson.get('difficulty'),
+                 lesson.get('text'), lesson.get('processed filename'))
+            )
+
+    def update_lesson(self, lesson_name, subject, date, difficulty):
+        """Updates the first lesson matching (lesson_name, subject). Returns False if there is none."""
+        with self._connect() as conn:
+            return conn.execute(
+                """UPDATE lessons SET date = ?, difficulty = ? WHERE id = (
+                       SELECT id FROM lessons WHERE lesson_name = ? AND subject = ? ORDER BY id LIMIT 1)""",
+                (date, difficulty, lesson_name, subject)
+            ).rowcount == 1
+
+    # --- Uploaded files ---
+    def list_files(self):
+        return [row['filename'] for row in self._connect().execute("SELECT filename FROM files ORDER BY id")]
+
+    def add_file(self, filename):
+        with self._connect() as conn:
+            return conn.execute("INSERT OR IGNORE INTO files (filename) VALUES (?)", (filename,)).rowcount == 1
+
+    # --- Content hashes of extracted texts ---
+    def get_text_hash(self, hashcode):
+        row = self._connect().execute("SELECT json_name FROM text_hashes WHERE hashcode = ?", (hashcode,)).fetchone()
+        return row['json_name'] if row else None
+
+    def set_text_hash(self, hashcode, json_name):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO text_hashes (hashcode, json_name) VALUES (?, ?)", (hashcode, json_name))
+
+    # --- Answer statistics per user and question ID (independent of how lessons are chunked) ---
+    def get_question_stats(self, hash_value, user_id=DEFAULT_USER_ID, question_ids=None):
+        """
+        {question_id: (number_of_tries, number_of_correct_tries)} of one user for one document,
+        limited to `question_ids` if given (primary key lookups instead of the whole document).
+        """
+        query = "SELECT question_id, number_of_tries, number_of_correct_tries FROM user_question_stats WHERE hash = ? AND user_id = ?"
+        conn = self._connect()
+        if question_ids is None:
+            rows = conn.execute(query, (hash_value, user_id)).fetchall()
+        else:
+            question_ids = list(dict.fromkeys(question_ids))
+            rows = []
+            for start in range(0, len(question_ids), STATS_QUERY_BATCH):
+                batch = question_ids[start:start + STATS_QUERY_BATCH]
+                rows += conn.execute(f"{query} AND question_id IN ({', '.join('?' * len(batch))})", (hash_value, user_id, *batch)).fetchall()
+        return {row['question_id']: (row['number_of_tries'], row['number_of_correct_tries']) for row in rows}
+
+    def set_question_stats(self, hash_value, updates, overwrite=True, user_id=DEFAULT_USER_ID):
+        """
+        Stores {question_id: (number_of_tries, number_of_correct_tries)} for one user. With
+        overwrite=False existing rows are kept (used to seed stats from old lesson files).
+        """
+        verb = "INSERT OR REPLACE" if overwrite else "INSERT OR IGNORE"
+        with self._connect() as conn:
+            conn.executemany(
+                f"{verb} INTO user_question_stats (hash, user_id, question_id, number_of_tries, number_of_correct_tries) VALUES (?, ?, ?, ?, ?)",
+                [(hash_value, user_id, question_id, tries, correct) for question_id, (tries, correct) in updates.items()]
+            )
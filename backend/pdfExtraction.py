@@ -0,0 +1,205 @@
+import fitz  # PyMuPDF for PDF text extraction
+import io
+import multiprocessing
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# "dict" extraction flags without TEXT_PRESERVE_IMAGES: image blocks never carry
+# text lines, so there is no point in decoding their pixel data for every page.
+PDF_TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+# Span records are spooled to a temporary file that stays in memory up to this size,
+# so the page walk does not hold every span of a large PDF in Python lists.
+SPAN_SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+SPAN_RECORD_HEADER = struct.Struct("<dI") # font size, byte length of the span text
+
+# Page-parallel extraction: documents with at least PDF_PARALLEL_MIN_PAGES pages are
+# split into page ranges that are laid out by PDF_EXTRACT_WORKERS worker processes.
+# PDF_EXTRACT_WORKERS=1 keeps everything on the calling thread.
+PDF_EXTRACT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "32"))
+PDF_MIN_PAGES_PER_TASK = 8
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def clean_text(text):
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'(\.{2,}|,{2,}|-{2,}|\s{2,})', ' ', text)
+    text = re.sub(r'\[\d+\]|\(\d+\)', '', text)
+    return text.strip()
+
+
+def scan_pages(doc, start, stop, add_span, pdf_path):
+    """
+    Walks pages [start, stop) once, passing every non-empty span to add_span(font_size, text).
+    Returns the font-size histogram of all spans on those pages (empty spans included).
+    """
+    font_size_counts = Counter()
+    for page_num in range(start, stop):
+        blocks = doc[page_num].get_text("dict", flags=PDF_TEXT_FLAGS)["blocks"]
+        if not blocks:
+            print(f"DEBUG: scan_pages: Page {page_num + 1} has no text blocks in 'dict' format for {pdf_path}", file=sys.stderr)
+        for block in blocks:
+            if "lines" in block:
+                for line in block["lines"]:
+                    for span in line["spans"]:
+                        font_size = span["size"]
+                        font_size_counts[font_size] += 1
+                        text = span["text"].strip()
+                        if text:
+                            add_span(font_size, text)
+    return font_size_counts
+
+
+def span_writer(spool):
+    """add_span for scan_pages() that appends span records to a binary file."""
+    def write_span(font_size, text):
+        encoded = text.encode("utf-8")
+        spool.write(SPAN_RECORD_HEADER.pack(font_size, len(encoded)))
+        spool.write(encoded)
+    return write_span
+
+
+def extract_page_range(pdf_path, start, stop):
+    """
+    Worker-process entry point: opens its own document, spools the spans of its pages
+    to a temporary file and returns (histogram, spool file path). The caller removes the file.
+    """
+    with tempfile.NamedTemporaryFile(prefix="pdfspans-", delete=False) as spool:
+        try:
+            with fitz.open(pdf_path) as doc:
+                font_size_counts = scan_pages(doc, start, stop, span_writer(spool), pdf_path)
+        except BaseException:
+            spool.close()
+            os.remove(spool.name)
+            raise
+    return font_size_counts, spool.name
+
+
+def iter_spooled_spans(spool):
+    spool.seek(0)
+    while True:
+        header = spool.read(SPAN_RECORD_HEADER.size)
+        if not header:
+            return
+        font_size, length = SPAN_RECORD_HEADER.unpack(header)
+        yield font_size, spool.read(length).decode("utf-8")
+
+
+def iter_range_spans(spool_paths):
+    for spool_path in spool_paths:
+        with open(spool_path, "rb") as spool:
+            yield from iter_spooled_spans(spool)
+
+
+def new_extraction_pool():
+    # spawn: the server process runs threads, which must not be forked. A spawned
+    # worker imports the parent's __main__ again as __mp_main__ before its first task,
+    # so the server module must not start anything at import time under that name.
+    return ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+
+def submit_page_ranges(pdf_path, ranges):
+    """Submits extract_page_range() for every range to the worker pool, in order."""
+    global _pool
+    # Worker processes are started on demand by submit()
+    with _pool_lock:
+        if _pool is None:
+            _pool = new_extraction_pool()
+        try:
+            return [_pool.submit(extract_page_range, pdf_path, start, stop) for start, stop in ranges]
+        except BrokenProcessPool:
+            # A worker died earlier; start over with a new pool
+            _pool = new_extraction_pool()
+            return [_pool.submit(extract_page_range, pdf_path, start, stop) for start, stop in ranges]
+
+
+def page_ranges(page_count, workers):
+    pages_per_task = max(PDF_MIN_PAGES_PER_TASK, -(-page_count // workers))
+    return [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+
+
+def classify_spans(spans, font_size_counts, pdf_path):
+    """Splits (font_size, text) spans into main text and footnotes around the dominant font size."""
+    if font_size_counts:
+        dominant_font_size = font_size_counts.most_common(1)[0][0]
+    else:
+        print(f"WARNING: classify_spans: No font sizes found for {pdf_path}. Defaulting to 10.", file=sys.stderr)
+        dominant_font_size = 10
+    footnote_threshold = dominant_font_size * 0.9
+
+    main_text_buffer, footnotes_buffer = io.StringIO(), io.StringIO()
+    for font_size, text in spans:
+        if font_size < footnote_threshold and font_size < dominant_font_size:
+            buffer = footnotes_buffer
+        else:
+            buffer = main_text_buffer
+        if buffer.tell():
+            buffer.write(" ")
+        buffer.write(text)
+    return main_text_buffer.getvalue(), footnotes_buffer.getvalue()
+
+
+def extract_spans_parallel(pdf_path, page_count):
+    ranges = page_ranges(page_count, PDF_EXTRACT_WORKERS)
+    print(f"DEBUG: Extracting {page_count} pages of {pdf_path} in {len(ranges)} ranges across {PDF_EXTRACT_WORKERS} processes", file=sys.stderr)
+    futures = submit_page_ranges(pdf_path, ranges)
+
+    # Merge in page order: Counter.update keeps first-seen order, so most_common()
+    # breaks ties exactly like the serial walk does. The spans stay in the workers'
+    # spool files and are streamed from them in page order.
+    font_size_counts = Counter()
+    spool_paths = []
+    try:
+        for future in futures:
+            range_counts, spool_path = future.result()
+            font_size_counts.update(range_counts)
+            spool_paths.append(spool_path)
+        return classify_spans(iter_range_spans(spool_paths), font_size_counts, pdf_path)
+    finally:
+        for future in futures:
+            try:
+                os.remove(future.result()[1])
+            except Exception:
+                pass # the range failed, or its file is gone already
+
+
+def extract_text_by_dynamic_font_size(pdf_path):
+    try:
+        doc = fitz.open(pdf_path)
+        print(f"DEBUG: Successfully opened PDF file: {pdf_path}", file=sys.stderr)
+    except Exception as e:
+        print(f"CRITICAL ERROR: Failed to open PDF file {pdf_path} in extract_text_by_dynamic_font_size: {e}", file=sys.stderr)
+        return "", ""
+
+    with doc:
+        page_count = doc.page_count
+        run_parallel = PDF_EXTRACT_WORKERS > 1 and page_count >= PDF_PARALLEL_MIN_PAGES
+        if not run_parallel:
+            # Single pass over the layout: build the font-size histogram and spool the
+            # non-empty span texts at the same time, then classify the spooled spans.
+            with tempfile.SpooledTemporaryFile(max_size=SPAN_SPOOL_MAX_MEMORY) as spool:
+                font_size_counts = scan_pages(doc, 0, page_count, span_writer(spool), pdf_path)
+                main_text, footnotes = classify_spans(iter_spooled_spans(spool), font_size_counts, pdf_path)
+
+    if run_parallel:
+        main_text, footnotes = extract_spans_parallel(pdf_path, page_count)
+
+    main_text_cleaned = clean_text(main_text)
+    footnotes_cleaned = clean_text(footnotes)
+
+    if not main_text_cleaned.strip() and not footnotes_cleaned.strip():
+        print(f"ERROR: Standard text extraction returned NO TEXT for {pdf_path}. This PDF may be image-based and requires OCR, which is currently disabled.", file=sys.stderr)
+        raise Exception("No text extracted from PDF via standard method. OCR is disabled.")
+    else:
+        print(f"INFO: Standard extraction found main text. Total length: {len(main_text_cleaned)}. First 200 chars:\n---START MAIN TEXT---\n{main_text_cleaned[:200].replace('\n', ' ').strip()}...\n---END MAIN TEXT---", file=sys.stderr)
+
+    return main_text_cleaned, footnotes_cleaned
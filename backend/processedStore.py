@@ -0,0 +1,42 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+from questionSchemas import randomize_correct_answer_indices
+from questionDedup import dedup_questions
+
+# Generated questions of every uploaded file, shared by the generators and the Flask app
+PROCESSED_FOLDER = "processed"
+
+
+def processed_filename(input_filename):
+    # Short hash of the uploaded file name, e.g. "1a2b3c4d.json"
+    return f"{hashlib.sha256(input_filename.encode()).hexdigest()[:8]}.json"
+
+
+def write_processed_file(input_filename, parsed_questions):
+    """
+    Writes the ParsedQuestion objects generated for `input_filename` to processed/
+    and returns the output filename.
+    """
+    # Overlapping chunks and cached re-runs repeat questions; keep one of each
+    parsed_questions = dedup_questions(parsed_questions)
+
+    # Randomize correct answer indices after all questions are generated
+    final_questions_for_output = randomize_correct_answer_indices(parsed_questions)
+
+    os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+    output_filename = processed_filename(input_filename)
+    output_path = os.path.join(PROCESSED_FOLDER, output_filename)
+    if not final_questions_for_output:
+        print(f"[WARNING] No questions generated in total for {output_path}. Writing empty array to file.", file=sys.stderr)
+
+    # Written aside and moved into place: the file is served straight from disk.
+    # Jobs for the same text write the same file, so each writer has its own temporary file.
+    tmp_path = f"{output_path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump([q.model_dump() for q in final_questions_for_output], f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, output_path)
+
+    return output_filename
@@ -0,0 +1,123 @@
+import importlib
+import sys
+import threading
+from chunkDispatcher import dispatch_chunks, get_rate_limiter
+from chunkBatcher import dispatch_batched
+from questionCache import cached_llm
+from questionSchemas import ParsedQuestion
+from textStore import get_materials
+from textChunker import chunk_text, chunk_token_budget
+from processedStore import write_processed_file
+
+# Providers tried in order for every chunk: (name, generator module, rate limit key).
+# All of them return ParsedQuestion objects, so their output shares one schema.
+PROVIDERS = [
+    ("fireworks", "fireReqObj", "FW"),
+    ("huggingface", "huggingReqObj", "HF"),
+]
+
+
+class ChunkProvider:
+    def __init__(self, name, module, rate_key):
+        self.name = name
+        self.module = module
+        self.rate_key = rate_key
+        self.limiter = get_rate_limiter(rate_key)
+        self.chunk_fn = cached_llm(module.llm, module.MODEL_NAME, module.PROMPT_VERSION, ParsedQuestion)
+
+    def generate(self, text):
+        self.limiter.acquire()
+        return self.chunk_fn(text)
+
+    def generate_all(self, parts, finish_chunk, progress=None):
+        """
+        Question lists for every part, in order. Providers with an llm_batch() get several
+        chunks per request (see chunkBatcher.py). finish_chunk(text, questions) is called
+        for every chunk and returns its final questions.
+        """
+        llm_batch = getattr(self.module, "llm_batch", None)
+        if llm_batch:
+            return dispatch_batched(parts, self.module.llm, llm_batch, self.module.MODEL_NAME, self.module.PROMPT_VERSION,
+                                    ParsedQuestion, self.rate_key, progress=progress, finish_chunk=finish_chunk)
+        # generate() applies the rate limit, so the dispatcher does not add one
+        return dispatch_chunks(parts, lambda part: finish_chunk(part, self.generate(part)), None, progress=progress)
+
+
+_providers = None
+_providers_lock = threading.Lock()
+
+
+def load_providers():
+    """Imports every provider module once per process and skips the ones that fail to load."""
+    global _providers
+    with _providers_lock:
+        if _providers is None:
+            _providers = []
+            for name, module_name, rate_key in PROVIDERS:
+                try:
+                    _providers.append(ChunkProvider(name, importlib.import_module(module_name), rate_key))
+                except Exception as e:
+                    print(f"[ERROR][Router] Could not load provider {name} ({module_name}): {e}", file=sys.stderr)
+        return _providers
+
+
+def generate_chunk(text, providers):
+    """
+    Returns (questions, provider_name) for one chunk, falling back to the next
+    provider only when the previous one failed or returned nothing for this chunk.
+    """
+    for provider in providers:
+        questions = provider.generate(text)
+        if questions:
+            return questions, provider.name
+        print(f"[WARNING][Router] {provider.name} returned no questions for a chunk, trying next provider. Chunk (first 100 chars): {text[:100]}...", file=sys.stderr)
+    return [], None
+
+
+def generate_processed_file(input_filename, progress=None):
+    """
+    Generates the questions for `input_filename` with per-chunk provider fallback,
+    writes them to processed/ and returns the output filename (e.g. "1a2b3c4d.json").
+    `progress`, if given, is called as
+    progress(chunks_done, chunks_total, questions_so_far, providers) where `providers`
+    counts the chunks answered by each provider so far.
+    """
+    providers = load_providers()
+    if not providers:
+        raise Exception("No question generation provider could be loaded.")
+
+    text, _ = get_materials(input_filename)
+    if not text.strip():
+        raise Exception(f"Retrieved empty text content for filename: '{input_filename}'. Cannot generate questions.")
+    # A chunk may be answered by any provider, so it has to fit the smallest context
+    parts = chunk_text(text, min(chunk_token_budget(provider.module.MODEL_NAME) for provider in providers))
+
+    provider_counts = {}
+    counts_lock = threading.Lock()
+
+    # The first provider answers every chunk (batched if it can); the chunks it
+    # returns nothing for fall back to the next providers one by one
+    first_provider, fallback_providers = providers[0], providers[1:]
+
+    def finish_chunk(part, questions):
+        provider_name = first_provider.name
+        if not questions:
+            print(f"[WARNING][Router] {first_provider.name} returned no questions for a chunk, trying next provider. Chunk (first 100 chars): {part[:100]}...", file=sys.stderr)
+            questions, provider_name = generate_chunk(part, fallback_providers)
+        if provider_name:
+            with counts_lock:
+                provider_counts[provider_name] = provider_counts.get(provider_name, 0) + 1
+        return questions
+
+    def report(chunks_done, chunks_total, questions_so_far):
+        if progress:
+            with counts_lock:
+                progress(chunks_done, chunks_total, questions_so_far, dict(provider_counts))
+
+    all_parsed_questions = []
+    for parsed_questions in first_provider.generate_all(parts, finish_chunk, progress=report):
+        all_parsed_questions.extend(parsed_questions)
+
+    print(f"[INFO][Router] {input_filename}: {len(parts)} chunks, answered per provider: {provider_counts}", file=sys.stderr)
+
+    return write_processed_file(input_filename, all_parsed_questions)
@@ -0,0 +1,176 @@
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+
+# Binary question bank: one file per processed document, read through mmap.
+#
+#   header     MAGIC, version, byte order, question count, arena size
+#   ids        count * ID_BYTES        question IDs (questionDedup.question_id) in bank order
+#   id_order   uint32[count]           bank positions sorted by ID, for lookups by ID
+#   correct    uint8[count]            correct_answer
+#   difficulty uint8[count]            difficulty_percentage, NO_DIFFICULTY if the question has none
+#   offsets    uint32[count * 5 + 1]   start of the question and its 4 choices in the arena
+#   arena      UTF-8 text of every question and choice, back to back
+#
+# Sections start on 8-byte boundaries. Lesson chunks are position files: uint32
+# positions into the bank (see write_positions), not copies of the questions.
+
+MAGIC = b"QBNK"
+VERSION = 1
+HEADER = struct.Struct("<4sHcxIQ")
+ID_BYTES = 8
+STRINGS_PER_QUESTION = 5 # question text and 4 choices
+NO_DIFFICULTY = 255
+BYTE_ORDER = b"<" if sys.byteorder == "little" else b">"
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _section_sizes(count, arena_size):
+    return [count * ID_BYTES, count * 4, count, count, (count * STRINGS_PER_QUESTION + 1) * 4, arena_size]
+
+
+def write_question_bank(path, questions):
+    """
+    Writes questions (dicts with id, question, choices, correct_answer and optionally
+    difficulty_percentage, as in processed/*.json) to a bank file, atomically.
+    """
+    count = len(questions)
+    ids = bytearray()
+    correct = array('B')
+    difficulty = array('B')
+    offsets = array('I', [0])
+    arena = bytearray()
+    for q in questions:
+        ids += bytes.fromhex(q['id'])
+        correct.append(q.get('correct_answer', 0))
+        difficulty.append(q.get('difficulty_percentage', NO_DIFFICULTY))
+        for text in [q.get('question', '')] + list(q.get('choices', []))[:STRINGS_PER_QUESTION - 1]:
+            arena += text.encode("utf-8")
+            offsets.append(len(arena))
+        for _ in range(STRINGS_PER_QUESTION - 1 - len(q.get('choices', []))):
+            offsets.append(len(arena)) # missing choices are empty strings
+    id_order = array('I', sorted(range(count), key=lambda position: ids[position * ID_BYTES:(position + 1) * ID_BYTES]))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, BYTE_ORDER, count, len(arena)))
+        for section in (bytes(ids), id_order.tobytes(), correct.tobytes(), difficulty.tobytes(), offsets.tobytes(), bytes(arena)):
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+            f.write(section)
+    os.replace(tmp_path, path)
+
+
+class QuestionBank:
+    """
+    Read-only view of a bank file. Nothing is parsed up front: the file is mapped
+    and questions are decoded on access, by position or by ID (binary search).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        if size < HEADER.size:
+            raise ValueError(f"Question bank {path} is truncated")
+        magic, version, byte_order, self.count, arena_size = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or byte_order != BYTE_ORDER:
+            raise ValueError(f"Question bank {path} has an unsupported format")
+
+        view = memoryview(self._map)
+        sections = []
+        offset = HEADER.size
+        for section_size in _section_sizes(self.count, arena_size):
+            offset = _align(offset)
+            sections.append(view[offset:offset + section_size])
+            offset += section_size
+        if offset > size:
+            raise ValueError(f"Question bank {path} is truncated")
+        self._ids, id_order, self.correct_answers, self.difficulties, offsets, self._arena = sections
+        self._id_order = id_order.cast('I')
+        self._offsets = offsets.cast('I')
+
+    def __len__(self):
+        return self.count
+
+    def _id_bytes(self, position):
+        return bytes(self._ids[position * ID_BYTES:(position + 1) * ID_BYTES])
+
+    def question_id(self, position):
+        return self._id_bytes(position).hex()
+
+    def position(self, question_id):
+        """Bank position of a question ID, or None."""
+        try:
+            wanted = bytes.fromhex(question_id)
+        except (TypeError, ValueError):
+            return None
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._id_bytes(self._id_order[middle]) < wanted:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self._id_bytes(self._id_order[low]) == wanted:
+            return self._id_order[low]
+        return None
+
+    def _text(self, index):
+        return str(self._arena[self._offsets[index]:self._offsets[index + 1]], "utf-8")
+
+    def question(self, position):
+        """The question at a position, as the dict written to processed/*.json."""
+        first = position * STRINGS_PER_QUESTION
+        q = {
+            'id': self.question_id(position),
+            'question': self._text(first),
+            'choices': [self._text(first + i) for i in range(1, STRINGS_PER_QUESTION)],
+            'correct_answer': self.correct_answers[position],
+        }
+        if self.difficulties[position] != NO_DIFFICULTY:
+            q['difficulty_percentage'] = self.difficulties[position]
+        return q
+
+    def questions(self, positions=None):
+        """Questions at the given positions (all of them by default), e.g. for JSON export."""
+        return [self.question(position) for position in (range(self.count) if positions is None else positions)]
+
+
+_open_banks = {} # path -> ((mtime_ns, size), QuestionBank)
+_open_banks_lock = threading.Lock()
+
+
+def open_question_bank(path):
+    """Shared QuestionBank for a file, reopened when the file is replaced. FileNotFoundError if missing."""
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _open_banks_lock:
+        entry = _open_banks.get(path)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+    bank = QuestionBank(path)
+    with _open_banks_lock:
+        _open_banks[path] = (stamp, bank)
+    return bank
+
+
+def read_positions(path):
+    """Bank positions stored in a lesson chunk file. FileNotFoundError if missing."""
+    positions = array('I')
+    with open(path, "rb") as f:
+        positions.frombytes(f.read())
+    return positions.tolist()
+
+
+def write_positions(path, positions):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(array('I', positions).tobytes())
+    os.replace(tmp_path, path)
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+QUESTION_CACHE_FOLDER = os.path.join("res", "question_cache")
+# Total size of cached chunk results on disk before the least recently used are evicted.
+QUESTION_CACHE_MAX_BYTES = int(os.environ.get("QUESTION_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+class QuestionCache:
+    """
+    Persistent cache of generated questions, keyed by (chunk text hash, model, prompt version).
+    Each entry is one small JSON file holding the validated question dicts for a chunk.
+    Reads refresh the file mtime, which is what the LRU eviction order is rebuilt from
+    after a restart.
+    """
+
+    def __init__(self, folder=QUESTION_CACHE_FOLDER, max_bytes=QUESTION_CACHE_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = None # path -> size, least recently used first
+        self._total_bytes = 0
+
+    @staticmethod
+    def make_key(text, model, prompt_version):
+        hasher = hashlib.sha256()
+        hasher.update(f"{model}\0{prompt_version}\0".encode("utf-8"))
+        hasher.update(text.encode("utf-8"))
+        return hasher.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], f"{key}.json")
+
+    def _load_index(self):
+        # Caller holds _lock. Scans the cache folder once per process.
+        if self._entries is not None:
+            return
+        found = []
+        if os.path.isdir(self.folder):
+            for root, _, files in os.walk(self.folder):
+                for name in files:
+                    if name.endswith(".json"):
+                        path = os.path.join(root, name)
+                        try:
+                            stat = os.stat(path)
+                        except OSError:
+                            continue
+                        found.append((stat.st_mtime, path, stat.st_size))
+        found.sort()
+        self._entries = OrderedDict((path, size) for _, path, size in found)
+        self._total_bytes = sum(self._entries.values())
+
+    def get(self, text, model, prompt_version):
+        path = self._path(self.make_key(text, model, prompt_version))
+        with self._lock:
+            self._load_index()
+            if path not in self._entries:
+                return None
+            self._entries.move_to_end(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                questions = json.load(f)
+            os.utime(path)
+            return questions
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"[WARNING][Cache] Dropping unreadable cache entry {path}: {e}", file=sys.stderr)
+            self._remove(path)
+            return None
+
+    def put(self, text, model, prompt_version, questions):
+        path = self._path(self.make_key(text, model, prompt_version))
+        data = json.dumps(questions, ensure_ascii=False).encode("utf-8")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._load_index()
+            self._total_bytes -= self._entries.pop(path, 0)
+            self._entries[path] = len(data)
+            self._total_bytes += len(data)
+            evicted = []
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_path, old_size = self._entries.popitem(last=False)
+                self._total_bytes -= old_size
+                evicted.append(old_path)
+        for old_path in evicted:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    def _remove(self, path):
+        with self._lock:
+            if self._entries is not None and path in self._entries:
+                self._total_bytes -= self._entries.pop(path)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+question_cache = QuestionCache()
+
+
+def cached_llm(llm_fn, model, prompt_version, schema=None):
+    """
+    Wraps a per-chunk llm(text) function so that chunks already answered for the same
+    model and prompt version are served from the question cache. Only non-empty results
+    are stored, so failed chunks are retried next time. `schema` is the pydantic model
+    the cached dicts are validated back into (plain dicts are returned without one).
+    """
+    def chunk_fn(text):
+        cached = question_cache.get(text, model, prompt_version)
+        if cached is not None:
+            try:
+                return [schema.model_validate(q) for q in cached] if schema else cached
+            except Exception as e:
+                print(f"[WARNING][Cache] Cached questions no longer validate, regenerating: {e}", file=sys.stderr)
+
+        questions = llm_fn(text)
+        if questions:
+            question_cache.put(text, model, prompt_version,
+                               [q.model_dump() if hasattr(q, "model_dump") else q for q in questions])
+        return questions
+
+    return chunk_fn
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import random
+import re
+import sys
+from collections import defaultdict
+
+# Two questions whose question/choice token sets have at least this Jaccard
+# similarity are considered the same question.
+DEDUP_SIMILARITY = float(os.environ.get("DEDUP_SIMILARITY", "0.8"))
+
+# MinHash signature of MINHASH_BANDS * MINHASH_ROWS values. Pairs land in a common LSH
+# bucket with probability 1 - (1 - s^rows)^bands, about 67% at s=0.6 and 98.5% at s=0.8.
+MINHASH_BANDS = 8
+MINHASH_ROWS = 4
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5EED) # fixed seed: signatures must not change between runs
+MINHASH_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+                        for _ in range(MINHASH_BANDS * MINHASH_ROWS)]
+
+NON_WORD = re.compile(r'[^\w\s]')
+
+
+def normalize_text(text):
+    return " ".join(NON_WORD.sub(" ", text.lower()).split())
+
+
+def question_id(question, choices):
+    """
+    Stable ID of a question: blake2b of its normalized text and normalized choices in
+    sorted order, so shuffling the answers or regenerating the document keeps the ID.
+    """
+    key = normalize_text(question) + "\0" + "\0".join(sorted(normalize_text(c) for c in choices))
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def shingles(question, choices):
+    words = normalize_text(question).split()
+    tokens = set(words)
+    tokens.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    for choice in choices:
+        tokens.update("c:" + word for word in normalize_text(choice).split())
+    return tokens
+
+
+def minhash_signature(tokens):
+    hashes = [int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "little") for t in tokens] or [0]
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in MINHASH_PERMUTATIONS]
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def dedup_questions(questions, similarity=DEDUP_SIMILARITY):
+    """
+    Drops exact (after normalization) and near-duplicate questions, keeping the first
+    occurrence. Near duplicates are found through MinHash/LSH buckets, so each question
+    is only compared with the few candidates that share a bucket with it.
+    `questions` are objects with .question and .choices (e.g. ParsedQuestion).
+    """
+    seen_ids = set()
+    kept = []
+    kept_shingles = []
+    buckets = defaultdict(list) # (band, band values) -> indices into kept
+    exact_duplicates = near_duplicates = 0
+
+    for q in questions:
+        qid = question_id(q.question, q.choices)
+        if qid in seen_ids:
+            exact_duplicates += 1
+            continue
+
+        tokens = shingles(q.question, q.choices)
+        signature = minhash_signature(tokens)
+        band_keys = [(band, tuple(signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS]))
+                     for band in range(MINHASH_BANDS)]
+        candidates = {index for key in band_keys for index in buckets.get(key, ())}
+        if any(jaccard(tokens, kept_shingles[index]) >= similarity for index in candidates):
+            near_duplicates += 1
+            continue
+
+        seen_ids.add(qid)
+        for key in band_keys:
+            buckets[key].append(len(kept))
+        kept.append(q)
+        kept_shingles.append(tokens)
+
+    if exact_duplicates or near_duplicates:
+        print(f"[INFO][Dedup] Dropped {exact_duplicates} exact and {near_duplicates} near-duplicate question(s), kept {len(kept)}", file=sys.stderr)
+    return kept
@@ -0,0 +1,74 @@
+import sys
+from lessonKeyStore import LessonKeyStore
+
+INDEX_FILENAME = "index.json"
+
+
+class QuestionIndex(LessonKeyStore):
+    """
+    Per-document index from question ID to its (lesson_number, offset) in the lesson
+    chunk files, so a question can be found in O(1) whatever the chunking is.
+    Updated whenever a chunk file is written or removed, and persisted to
+    <lessons_root>/<hash>/index.json (as lesson_number -> [question IDs]) by save_dirty().
+    """
+
+    FILENAME = INDEX_FILENAME
+
+    def __init__(self, lessons_root, load_chunks_fn):
+        # load_chunks_fn(hash_value) -> {lesson_number: questions}; only used to build
+        # the index of a document that has no index file yet.
+        super().__init__(lessons_root)
+        self.load_chunks_fn = load_chunks_fn
+
+    def _build(self, hash_value):
+        lessons = {lesson_number: [q.get('id') for q in questions]
+                   for lesson_number, questions in self.load_chunks_fn(hash_value).items()}
+        print(f"[INFO][Index] Built question index for {hash_value} from its lesson files", file=sys.stderr)
+        return self._from_lessons(lessons)
+
+    def _from_file(self, stored):
+        return self._from_lessons({int(lesson_number): ids for lesson_number, ids in stored.items()})
+
+    @staticmethod
+    def _to_file(document):
+        return document['lessons']
+
+    def _from_lessons(self, lessons):
+        # document: {'lessons': {lesson_number: [ids]}, 'locations': {id: (lesson_number, offset)}}
+        document = {'lessons': {}, 'locations': {}}
+        for lesson_number, ids in lessons.items():
+            self._set(document, lesson_number, ids)
+        return document
+
+    @staticmethod
+    def _set(document, lesson_number, ids):
+        for question_id in document['lessons'].get(lesson_number, ()):
+            if document['locations'].get(question_id, (None,))[0] == lesson_number:
+                del document['locations'][question_id]
+        document['lessons'][lesson_number] = ids
+        for offset, question_id in enumerate(ids):
+            if question_id:
+                document['locations'][question_id] = (lesson_number, offset)
+
+    def set_lesson(self, hash_value, lesson_number, questions):
+        """Records the IDs of a lesson chunk that was just written."""
+        hash_value = self._key(hash_value)
+        document = self._document(hash_value)
+        with self._lock:
+            self._set(document, int(lesson_number), [q.get('id') for q in questions])
+            self._dirty.add(hash_value)
+
+    def remove_lesson(self, hash_value, lesson_number):
+        hash_value = self._key(hash_value)
+        document = self._document(hash_value)
+        with self._lock:
+            self._set(document, int(lesson_number), [])
+            del document['lessons'][int(lesson_number)]
+            self._dirty.add(hash_value)
+
+    def locate(self, hash_value, question_id):
+        """(lesson_number, offset) of a question, or None if no lesson holds it."""
+        hash_value = self._key(hash_value)
+        document = self._document(hash_value)
+        with self._lock:
+            return document['locations'].get(question_id)
@@ -0,0 +1,103 @@
+import random
+import sys
+import os
+from pydantic import BaseModel, Field
+from typing import List
+from questionDedup import question_id
+
+# Question schemas shared by every generator (fireReqObj, huggingReqObj and the
+# provider router), so questions from any provider end up in the same format.
+
+# --- Pydantic Schemas ---
+
+# Temporary schema for parsing LLM output BEFORE randomization
+# We expect the LLM to still put the conceptual correct answer at index 0 initially
+class ParsedQuestion(BaseModel):
+    question: str
+    choices: List[str] = Field(..., min_items=4, max_items=4)
+    # The LLM will be prompted to put the correct answer at index 0,
+    # but we'll re-randomize this later.
+    correct_answer: int = Field(..., ge=0, le=3)
+    difficulty_percentage: int = Field(..., ge=0, le=100) # Added difficulty
+
+class ParsedQuestionList(BaseModel):
+    questions: List[ParsedQuestion]
+
+# Answer to a batched prompt: the questions for every labeled section of the text
+class ParsedSection(BaseModel):
+    section: int
+    questions: List[ParsedQuestion]
+
+class ParsedSectionList(BaseModel):
+    sections: List[ParsedSection]
+
+# Final schema for the output JSON after randomization
+class Question(BaseModel):
+    id: str # stable question ID, see questionDedup.question_id
+    question: str
+    choices: List[str] = Field(..., min_items=4, max_items=4)
+    correct_answer: int = Field(..., ge=0, le=3)
+    difficulty_percentage: int = Field(..., ge=0, le=100) # Added difficulty
+
+class FinalQuestionList(BaseModel): # Renamed to avoid conflict if QuestionList is used elsewhere
+    questions: List[Question]
+
+# --- Answer Position Randomization ---
+
+# Correct answer positions are balanced within every block of this many consecutive
+# questions (one lesson), so no lesson is dominated by one answer position.
+ANSWER_POSITION_BLOCK = int(os.environ.get("ANSWER_POSITION_BLOCK", "15"))
+NUM_CHOICES = 4
+
+def assign_answer_positions(count, block=ANSWER_POSITION_BLOCK, rng=random):
+    """
+    Correct answer positions (0-3) for `count` questions in O(count): every block of
+    `block` questions gets a shuffled round-robin over a random order of the positions,
+    so within a block the positions are used equally often, give or take one.
+    """
+    positions = []
+    for start in range(0, count, block):
+        order = list(range(NUM_CHOICES))
+        rng.shuffle(order)
+        block_positions = [order[i % NUM_CHOICES] for i in range(min(block, count - start))]
+        rng.shuffle(block_positions)
+        positions.extend(block_positions)
+    return positions
+
+def randomize_correct_answer_indices(questions: List[ParsedQuestion]) -> List[Question]:
+    """
+    Moves the correct answer of each question (put at index 0 by the LLM) to a new
+    position from assign_answer_positions(), so positions are balanced per lesson.
+    """
+    final_questions = []
+    positions = assign_answer_positions(len(questions))
+
+    for i, (pq, new_correct_index) in enumerate(zip(questions, positions)):
+        # Ensure choices list has at least 4 elements before proceeding
+        if len(pq.choices) < NUM_CHOICES:
+            print(f"Warning: Question {i+1} has less than 4 choices. Skipping randomization for this question.", file=sys.stderr)
+            final_questions.append(
+                Question(
+                    id=question_id(pq.question, pq.choices),
+                    question=pq.question,
+                    choices=pq.choices,
+                    correct_answer=pq.correct_answer, # This would still be 0 as per ParsedQuestion
+                    difficulty_percentage=pq.difficulty_percentage
+                )
+            )
+            continue # Move to the next question
+
+        # Swap the correct answer (index 0) with the distractor at its new index
+        new_choices = list(pq.choices) # Create a mutable copy
+        new_choices[0], new_choices[new_correct_index] = new_choices[new_correct_index], new_choices[0]
+
+        final_questions.append(
+            Question(
+                id=question_id(pq.question, pq.choices),
+                question=pq.question,
+                choices=new_choices,
+                correct_answer=new_correct_index,
+                difficulty_percentage=pq.difficulty_percentage
+            )
+        )
+    return final_questions
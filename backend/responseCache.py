@@ -0,0 +1,82 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Total size of the cached response bodies before the least recently used are evicted
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Misses on different entries are built concurrently, misses on the same entry once
+BUILD_LOCK_STRIPES = 64
+
+
+class ResponseCache:
+    """
+    LRU cache of encoded response bodies within a byte budget. Entries are grouped
+    (e.g. by lesson key) and each one is stored with a stamp chosen by the caller
+    (e.g. file mtimes) and the version of its group at the time it was built.
+    An entry is only served while both still match: invalidate(group) bumps the
+    version, so every entry of the group built before the call is dropped on its
+    next use. Call it after the data the bodies are built from has changed.
+    """
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # (group, item) -> (stamp, version, body), least recently used first
+        self._versions = {}           # group -> number of invalidate() calls
+        self._build_locks = [threading.Lock() for _ in range(BUILD_LOCK_STRIPES)]
+        self._total_bytes = 0
+
+    def version(self, group):
+        with self._lock:
+            return self._versions.get(group, 0)
+
+    def _lookup(self, entry_key, stamp, version):
+        # Caller holds _lock
+        entry = self._entries.get(entry_key)
+        if entry is not None and entry[0] == stamp and entry[1] == version:
+            self._entries.move_to_end(entry_key)
+            return entry[2]
+        return None
+
+    def body(self, group, item, stamp, build_fn):
+        """
+        Cached body of (group, item) for `stamp`, or build_fn() stored under it.
+        The group version is read before build_fn runs, so a body built from data
+        that changed meanwhile is stored under the old version and never served.
+        """
+        entry_key = (group, item)
+        with self._lock:
+            version = self._versions.get(group, 0)
+            body = self._lookup(entry_key, stamp, version)
+        if body is not None:
+            return body
+        with self._build_locks[hash(entry_key) % BUILD_LOCK_STRIPES]:
+            with self._lock:
+                version = self._versions.get(group, 0)
+                body = self._lookup(entry_key, stamp, version)
+            if body is not None:
+                return body
+            body = build_fn()
+            with self._lock:
+                self._remove(entry_key)
+                if len(body) <= self.max_bytes:
+                    self._entries[entry_key] = (stamp, version, body)
+                    self._total_bytes += len(body)
+                    self._evict()
+        return body
+
+    def _remove(self, entry_key):
+        # Caller holds _lock
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self._total_bytes -= len(entry[2])
+
+    def _evict(self):
+        # Caller holds _lock
+        while self._total_bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._total_bytes -= len(entry[2])
+
+    def invalidate(self, group):
+        with self._lock:
+            self._versions[group] = self._versions.get(group, 0) + 1
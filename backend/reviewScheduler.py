@@ -0,0 +1,129 @@
+import heapq
+import os
+import sys
+import time
+from lessonKeyStore import LessonKeyStore
+
+SCHEDULE_FILENAME = "schedule.json"
+
+# A question answered wrong comes back after REVIEW_RETRY_SECONDS. A right answer pushes
+# it out by REVIEW_BASE_SECONDS, growing REVIEW_GROWTH times with every further right
+# answer in a row and scaled by the question's overall accuracy, up to REVIEW_MAX_SECONDS.
+REVIEW_RETRY_SECONDS = float(os.environ.get("REVIEW_RETRY_SECONDS", "60"))
+REVIEW_BASE_SECONDS = float(os.environ.get("REVIEW_BASE_SECONDS", "600"))
+REVIEW_GROWTH = float(os.environ.get("REVIEW_GROWTH", "2.5"))
+REVIEW_MAX_SECONDS = float(os.environ.get("REVIEW_MAX_SECONDS", str(30 * 24 * 3600)))
+
+# Item fields
+DUE, STREAK, TRIES, CORRECT, LAST_ANSWERED, SEQ = range(6)
+
+
+def accuracy(tries, correct):
+    # Smoothed correct rate, so one lucky answer does not count as mastered
+    return (correct + 1) / (tries + 2)
+
+
+def review_interval(tries, correct, streak):
+    if streak == 0:
+        return REVIEW_RETRY_SECONDS
+    interval = REVIEW_BASE_SECONDS * REVIEW_GROWTH ** (streak - 1) * (0.5 + accuracy(tries, correct))
+    return min(interval, REVIEW_MAX_SECONDS)
+
+
+class ReviewScheduler(LessonKeyStore):
+    """
+    Spaced-repetition schedule of every lesson key (see app.lesson_key): when each
+    answered question is due for review. Each key has a min-heap of
+    (due, accuracy, seq, question_id) with lazy deletion, so recording an answer is
+    O(log n) and the next N reviews are found in O(N log n), without re-sorting the
+    bank. Schedules are persisted to <lessons_root>/<key>/schedule.json by save_dirty().
+    """
+
+    FILENAME = SCHEDULE_FILENAME
+
+    def __init__(self, lessons_root, load_stats_fn):
+        # load_stats_fn(key) -> {question_id: (tries, correct)}; only used to build the
+        # schedule of a key that has no schedule file yet (all of it due, weakest first).
+        super().__init__(lessons_root)
+        self.load_stats_fn = load_stats_fn
+        self._seq = 0
+
+    def _build(self, key):
+        # No recency known: everything answered is due now
+        items = {question_id: [0.0, 0, tries, correct, None, 0]
+                 for question_id, (tries, correct) in self.load_stats_fn(key).items() if tries > 0}
+        print(f"[INFO][Review] Built review schedule for {key} from its answer stats", file=sys.stderr)
+        return self._from_items(items)
+
+    def _from_file(self, stored):
+        return self._from_items({question_id: item + [0] for question_id, item in stored.items()})
+
+    @staticmethod
+    def _to_file(document):
+        return {question_id: item[:SEQ] for question_id, item in document['items'].items()}
+
+    @staticmethod
+    def _from_items(items):
+        # document: {'items': {question_id: item}, 'heap': [entries]}; the heap is filled by _prepare()
+        return {'items': items, 'heap': []}
+
+    def _prepare(self, document):
+        self._rebuild_heap(document)
+
+    def _entry(self, question_id, item):
+        self._seq += 1
+        item[SEQ] = self._seq
+        return (item[DUE], accuracy(item[TRIES], item[CORRECT]), item[SEQ], question_id)
+
+    def _rebuild_heap(self, document):
+        document['heap'] = [self._entry(question_id, item) for question_id, item in document['items'].items()]
+        heapq.heapify(document['heap'])
+
+    def record_answer(self, key, question_id, number_of_tries, number_of_correct_tries, now=None):
+        """Reschedules a question from its new cumulative stats, in O(log n)."""
+        key = self._key(key)
+        now = time.time() if now is None else now
+        document = self._document(key)
+        with self._lock:
+            item = document['items'].get(question_id) or [0.0, 0, 0, 0, None, 0]
+            new_tries = number_of_tries - item[TRIES]
+            new_correct = number_of_correct_tries - item[CORRECT]
+            item[TRIES], item[CORRECT] = number_of_tries, number_of_correct_tries
+            if number_of_tries <= 0:
+                document['items'].pop(question_id, None)
+                self._dirty.add(key)
+                return
+            if new_tries > 0:
+                item[STREAK] = item[STREAK] + 1 if new_correct >= new_tries else 0
+                item[DUE] = now + review_interval(number_of_tries, number_of_correct_tries, item[STREAK])
+                item[LAST_ANSWERED] = now
+            document['items'][question_id] = item
+            heapq.heappush(document['heap'], self._entry(question_id, item))
+            # Superseded entries are skipped when popped; drop them once they dominate the heap
+            if len(document['heap']) > 2 * len(document['items']) + 64:
+                self._rebuild_heap(document)
+            self._dirty.add(key)
+
+    def forget(self, key, question_id):
+        """Takes a question out of the schedule (e.g. it is no longer in the bank)."""
+        key = self._key(key)
+        document = self._document(key)
+        with self._lock:
+            if document['items'].pop(question_id, None) is not None:
+                self._dirty.add(key)
+
+    def next_reviews(self, key, count):
+        """[(question_id, due)] of the `count` questions due soonest (overdue first)."""
+        key = self._key(key)
+        document = self._document(key)
+        with self._lock:
+            heap, items = document['heap'], document['items']
+            found = []
+            while heap and len(found) < count:
+                entry = heapq.heappop(heap)
+                item = items.get(entry[3])
+                if item is not None and item[SEQ] == entry[2]:
+                    found.append(entry)
+            for entry in found:
+                heapq.heappush(heap, entry)
+            return [(entry[3], entry[0]) for entry in found]
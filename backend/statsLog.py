@@ -0,0 +1,172 @@
+import json
+import os
+import sys
+import threading
+
+# The compactor folds pending answers into the stats store every STATS_COMPACT_INTERVAL
+# seconds, or as soon as STATS_COMPACT_MAX_PENDING answers are waiting.
+STATS_COMPACT_INTERVAL = float(os.environ.get("STATS_COMPACT_INTERVAL", "2.0"))
+STATS_COMPACT_MAX_PENDING = int(os.environ.get("STATS_COMPACT_MAX_PENDING", "500"))
+
+
+class StatsLog:
+    """
+    Write-behind log for answer statistics. record() appends one line to an
+    append-only log and updates an in-memory map, so an answer costs O(1)
+    regardless of the lesson size. Answers are keyed by question ID, so they stay
+    attached to the right question while lessons are re-chunked. A background
+    compactor periodically hands the latest values per key (a document hash, or
+    a user's lessons of it) to `apply_fn(hash_value, updates)`, where updates maps
+    question_id -> (number_of_tries, number_of_correct_tries), calls
+    `after_compact()` if given, and then drops the compacted part of the log.
+    Answers that apply_fn raised on stay pending and are retried with the next batch.
+    Readers merge values that are not compacted yet through apply_pending().
+
+    Events left in the log by a crash are replayed on first use.
+    """
+
+    def __init__(self, log_path, apply_fn, interval=STATS_COMPACT_INTERVAL, max_pending=STATS_COMPACT_MAX_PENDING, after_compact=None):
+        self.log_path = log_path
+        self.compacting_path = log_path + ".compacting"
+        self.apply_fn = apply_fn
+        self.after_compact = after_compact # called once after every compacted batch
+        self.interval = interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending = {}    # hash_value -> {question_id: (tries, correct)}
+        self._compacting = {} # batch currently being written by the compactor
+        self._pending_count = 0
+        self._log = None
+        self._started = False
+
+    @staticmethod
+    def _key(hash_value):
+        if hash_value.endswith('.json'):
+            hash_value = hash_value[:-5]
+        return hash_value
+
+    def _ensure_started(self):
+        # Started lazily so that a process which never serves requests (e.g. the
+        # reloader parent of the debug server) never touches the log.
+        with self._lock:
+            if self._started:
+                return
+            for path in (self.compacting_path, self.log_path):
+                self._replay(path)
+            os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+            self._log = open(self.log_path, "a", encoding="utf-8")
+            self._started = True
+            threading.Thread(target=self._compactor_loop, name="stats-compactor", daemon=True).start()
+        if self._pending_count:
+            self._wake.set()
+
+    def _replay(self, path):
+        # Caller holds _lock
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    hash_value, question_id, tries, correct = json.loads(line)
+                except (ValueError, TypeError):
+                    continue # torn last line after a crash
+                self._pending.setdefault(self._key(hash_value), {})[question_id] = (tries, correct)
+                self._pending_count += 1
+        print(f"[INFO][StatsLog] Replayed pending answer events from {path}", file=sys.stderr)
+
+    def record(self, hash_value, question_id, number_of_tries, number_of_correct_tries):
+        self._ensure_started()
+        key = self._key(hash_value)
+        line = json.dumps([key, question_id, number_of_tries, number_of_correct_tries])
+        with self._lock:
+            self._log.write(line + "\n")
+            self._log.flush()
+            self._pending.setdefault(key, {})[question_id] = (number_of_tries, number_of_correct_tries)
+            self._pending_count += 1
+            if self._pending_count >= self.max_pending:
+                self._wake.set()
+
+    def apply_pending(self, hash_value, questions):
+        """
+        Overlays answers that are not compacted yet onto `questions` (matched by their
+        'id') in place. Returns the indices of the questions that were changed.
+        """
+        updates = self.pending(hash_value)
+        if not updates:
+            return []
+        changed = []
+        for question_index, question in enumerate(questions):
+            stats = updates.get(question.get('id'))
+            if stats is not None:
+                question['number_of_tries'], question['number_of_correct_tries'] = stats
+                changed.append(question_index)
+        return changed
+
+    def pending(self, hash_value):
+        """{question_id: (tries, correct)} of the answers that are not compacted yet."""
+        self._ensure_started()
+        key = self._key(hash_value)
+        with self._lock:
+            updates = dict(self._compacting.get(key, {}))
+            updates.update(self._pending.get(key, {}))
+        return updates
+
+    def flush(self):
+        """Compacts everything recorded so far before returning."""
+        self._ensure_started()
+        self._compact()
+
+    def _compactor_loop(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self._compact()
+            except Exception as e:
+                print(f"[ERROR][StatsLog] Compaction failed: {e}", file=sys.stderr)
+
+    def _compact(self):
+        with self._compact_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                batch, self._pending, self._pending_count = self._pending, {}, 0
+                self._compacting = batch
+                # Rotate the log: new answers go to a fresh file while this batch is applied
+                self._log.close()
+                if os.path.exists(self.compacting_path):
+                    # Left over from an interrupted compaction; its events are already in this batch
+                    with open(self.compacting_path, "a", encoding="utf-8") as old, open(self.log_path, "r", encoding="utf-8") as new:
+                        old.write(new.read())
+                    os.remove(self.log_path)
+                else:
+                    os.replace(self.log_path, self.compacting_path)
+                self._log = open(self.log_path, "a", encoding="utf-8")
+
+            failed = {}
+            for hash_value, updates in batch.items():
+                try:
+                    self.apply_fn(hash_value, updates)
+                except Exception as e:
+                    failed[hash_value] = updates
+                    print(f"[ERROR][StatsLog] Could not apply {len(updates)} answer(s) (hash: {hash_value}), retrying with the next batch: {e}", file=sys.stderr)
+
+            if self.after_compact:
+                try:
+                    self.after_compact()
+                except Exception as e:
+                    print(f"[ERROR][StatsLog] after_compact hook failed: {e}", file=sys.stderr)
+
+            with self._lock:
+                # Failed answers go back to pending, behind anything recorded since, and
+                # the rotated log is kept so a crash before the retry still replays them
+                for hash_value, updates in failed.items():
+                    updates = dict(updates)
+                    updates.update(self._pending.get(hash_value, {}))
+                    self._pending[hash_value] = updates
+                    self._pending_count += len(updates)
+                self._compacting = {}
+                if not failed:
+                    os.remove(self.compacting_path)
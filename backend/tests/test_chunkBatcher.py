@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+import chunkBatcher
+from chunkBatcher import dispatch_batched
+from questionCache import QuestionCache
+from questionSchemas import ParsedQuestion
+
+MODEL = "test-model"
+PROMPT_VERSION = "test-1"
+
+
+def question(text, n):
+    return ParsedQuestion(question=f"{text} #{n}", choices=["a", "b", "c", "d"], correct_answer=0, difficulty_percentage=50)
+
+
+class MockProvider:
+    """Canned llm / llm_batch: one question per section, none for texts in `empty`."""
+
+    def __init__(self, empty=()):
+        self.empty = set(empty)
+        self.batches = []
+        self.singles = []
+        self._lock = threading.Lock()
+
+    def llm(self, text):
+        with self._lock:
+            self.singles.append(text)
+        return [question(text, "alone")]
+
+    def llm_batch(self, texts):
+        with self._lock:
+            self.batches.append(list(texts))
+        return [[] if text in self.empty else [question(text, "batched")] for text in texts]
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(chunkBatcher, "question_cache", QuestionCache(folder=str(tmp_path / "cache")))
+
+
+def dispatch(parts, provider, **kwargs):
+    return dispatch_batched(parts, provider.llm, provider.llm_batch, MODEL, PROMPT_VERSION,
+                            ParsedQuestion, None, max_chunks=4, **kwargs)
+
+
+def test_batches_and_retries_empty_sections():
+    parts = ["alpha text", "beta text", "gamma text"]
+    provider = MockProvider(empty={"beta text"})
+    progress = []
+
+    results = dispatch(parts, provider, progress=lambda *args: progress.append(args))
+
+    assert provider.batches == [parts]
+    assert provider.singles == ["beta text"]
+    assert [[q.question for q in r] for r in results] == [
+        ["alpha text #batched"], ["beta text #alone"], ["gamma text #batched"]]
+    assert progress[-1] == (3, 3, 3)
+
+
+def test_cached_chunks_are_not_requested_again():
+    parts = ["alpha text", "beta text"]
+    dispatch(parts, MockProvider())
+
+    provider = MockProvider()
+    results = dispatch(parts + ["delta text"], provider)
+    assert provider.batches == []
+    assert provider.singles == ["delta text"] # a batch of one is sent on its own
+    assert [len(r) for r in results] == [1, 1, 1]
+
+
+def test_failed_batch_falls_back_to_single_requests():
+    class FailingBatch(MockProvider):
+        def llm_batch(self, texts):
+            raise RuntimeError("502 Bad Gateway")
+
+    provider = FailingBatch()
+    results = dispatch(["alpha text", "beta text"], provider)
+    assert sorted(provider.singles) == ["alpha text", "beta text"]
+    assert [[q.question for q in r] for r in results] == [["alpha text #alone"], ["beta text #alone"]]
+
+
+def test_finish_chunk_replaces_empty_results():
+    provider = MockProvider(empty={"beta text"})
+    provider.llm = lambda text: []
+    results = dispatch(["alpha text", "beta text"], provider,
+                       finish_chunk=lambda text, questions: questions or [question(text, "fallback")])
+    assert [[q.question for q in r] for r in results] == [["alpha text #batched"], ["beta text #fallback"]]
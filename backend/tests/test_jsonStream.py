@@ -0,0 +1,36 @@
+from jsonStream import JsonArrayItemStream
+
+
+def feed_in_pieces(text, size):
+    stream = JsonArrayItemStream()
+    items = []
+    for start in range(0, len(text), size):
+        items += stream.feed(text[start:start + size])
+    return stream, items
+
+
+def test_bare_array_in_small_pieces():
+    text = '[{"q": "a [b] {c}", "n": 1}, {"q": "quote \\" and \\\\", "n": 2}]'
+    for size in (1, 3, len(text)):
+        stream, items = feed_in_pieces(text, size)
+        assert items == [{"q": "a [b] {c}", "n": 1}, {"q": "quote \" and \\", "n": 2}]
+        assert not stream.incomplete
+
+
+def test_fenced_output_under_a_key():
+    text = 'Here are your questions:\n```json\n{"questions": [{"n": 1, "choices": ["x", "y"]}, {"n": 2, "choices": []}]}\n```\nGood luck!'
+    stream, items = feed_in_pieces(text, 7)
+    assert items == [{"n": 1, "choices": ["x", "y"]}, {"n": 2, "choices": []}]
+    assert not stream.incomplete
+
+
+def test_cut_off_output_keeps_complete_items():
+    text = '```json\n{"questions": [{"n": 1}, {"n": 2}, {"n": 3, "question": "Which of the fol'
+    stream, items = feed_in_pieces(text, 5)
+    assert items == [{"n": 1}, {"n": 2}]
+    assert stream.incomplete
+
+
+def test_malformed_item_is_skipped():
+    stream, items = feed_in_pieces('[{"n": 1}, {"n": 2,}, {"n": 3}]', 4)
+    assert items == [{"n": 1}, {"n": 3}]
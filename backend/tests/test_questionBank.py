@@ -0,0 +1,63 @@
+from questionBank import QuestionBank, write_question_bank, read_positions, write_positions
+from questionDedup import question_id
+
+
+def make_question(i, **extra):
+    q = {
+        'question': f"Question {i} — ünïcode?",
+        'choices': [f"a{i}", f"b{i}", f"c{i}", f"d{i}"],
+        'correct_answer': i % 4,
+        'difficulty_percentage': (i * 13) % 101,
+    }
+    q['id'] = question_id(q['question'], q['choices'])
+    q.update(extra)
+    return q
+
+
+def test_round_trip(tmp_path):
+    questions = [make_question(i) for i in range(50)]
+    path = tmp_path / "doc.qbank"
+    write_question_bank(str(path), questions)
+
+    bank = QuestionBank(str(path))
+    assert len(bank) == 50
+    assert bank.questions() == questions
+    assert bank.questions([7, 3]) == [questions[7], questions[3]]
+
+
+def test_missing_difficulty_and_choices(tmp_path):
+    q = make_question(1, choices=["only", "two"])
+    del q['difficulty_percentage']
+    path = tmp_path / "doc.qbank"
+    write_question_bank(str(path), [q])
+
+    decoded = QuestionBank(str(path)).question(0)
+    assert decoded['choices'] == ["only", "two", "", ""]
+    assert 'difficulty_percentage' not in decoded
+
+
+def test_id_lookup(tmp_path):
+    questions = [make_question(i) for i in range(200)]
+    path = tmp_path / "doc.qbank"
+    write_question_bank(str(path), questions)
+
+    bank = QuestionBank(str(path))
+    for position, q in enumerate(questions):
+        assert bank.question_id(position) == q['id']
+        assert bank.position(q['id']) == position
+    assert bank.position("0" * 16) is None
+    assert bank.position("not hex") is None
+
+
+def test_empty_bank(tmp_path):
+    path = tmp_path / "empty.qbank"
+    write_question_bank(str(path), [])
+    bank = QuestionBank(str(path))
+    assert len(bank) == 0
+    assert bank.position(make_question(0)['id']) is None
+
+
+def test_positions_round_trip(tmp_path):
+    path = tmp_path / "lesson0.idx"
+    write_positions(str(path), [5, 0, 123456])
+    assert read_positions(str(path)) == [5, 0, 123456]
@@ -0,0 +1,62 @@
+import json
+import os
+
+from statsLog import StatsLog
+
+
+def write_events(path, events):
+    with open(path, "w", encoding="utf-8") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+
+
+def new_log(log_path, applied, fail_keys=()):
+    def apply_fn(key, updates):
+        if key in fail_keys:
+            raise RuntimeError("store unavailable")
+        applied.setdefault(key, {}).update(updates)
+    # No background compaction during the test: everything goes through flush()
+    return StatsLog(str(log_path), apply_fn, interval=3600, max_pending=10 ** 6)
+
+
+def test_replays_leftover_compacting_file(tmp_path):
+    log_path = tmp_path / "stats_events.log"
+    # Crash during a compaction: the rotated batch and newer answers are both on disk
+    write_events(str(log_path) + ".compacting", [["h1", "q1", 1, 0], ["h1", "q2", 1, 1]])
+    write_events(str(log_path), [["h1", "q1", 2, 1], ["h2", "q9", 1, 1]])
+    with open(log_path, "a", encoding="utf-8") as f:
+        f.write('["h2", "q8", 1') # torn last line
+
+    applied = {}
+    stats_log = new_log(log_path, applied)
+    # Events of the current log are newer than those of the interrupted compaction
+    assert stats_log.pending("h1") == {"q1": (2, 1), "q2": (1, 1)}
+    assert stats_log.pending("h2.json") == {"q9": (1, 1)}
+
+    stats_log.flush()
+    assert applied == {"h1": {"q1": (2, 1), "q2": (1, 1)}, "h2": {"q9": (1, 1)}}
+    assert stats_log.pending("h1") == {}
+    assert not os.path.exists(str(log_path) + ".compacting")
+
+
+def test_failed_apply_stays_pending(tmp_path):
+    log_path = tmp_path / "stats_events.log"
+    applied = {}
+    stats_log = new_log(log_path, applied, fail_keys={"h1"})
+    stats_log.record("h1", "q1", 1, 0)
+    stats_log.record("h2", "q2", 1, 1)
+
+    stats_log.flush()
+    assert applied == {"h2": {"q2": (1, 1)}}
+    assert stats_log.pending("h1") == {"q1": (1, 0)}
+    # Kept so that a crash before the retry still replays the failed answer
+    assert os.path.exists(str(log_path) + ".compacting")
+
+
+def test_apply_pending_overlays_questions(tmp_path):
+    stats_log = new_log(tmp_path / "stats_events.log", {})
+    stats_log.record("h1", "q2", 3, 2)
+    questions = [{'id': "q1", 'number_of_tries': 1}, {'id': "q2", 'number_of_tries': 0}]
+    assert stats_log.apply_pending("h1", questions) == [1]
+    assert questions[1]['number_of_tries'] == 3
+    assert questions[1]['number_of_correct_tries'] == 2
@@ -0,0 +1,107 @@
+import os
+import re
+
+# Target size of one chunk in (estimated) tokens. It is capped for each model so the
+# prompt, the chunk and the answer always fit into the model's context window.
+CHUNK_TOKEN_BUDGET = int(os.environ.get("CHUNK_TOKEN_BUDGET", "1400"))
+# Sentences repeated from the end of the previous chunk at the start of the next one
+CHUNK_OVERLAP_SENTENCES = int(os.environ.get("CHUNK_OVERLAP_SENTENCES", "0"))
+# A last chunk smaller than this fraction of the budget is merged into the previous one
+MIN_CHUNK_FRACTION = 0.25
+
+MODEL_CONTEXT_TOKENS = {
+    "accounts/fireworks/models/llama-v3p1-8b-instruct": 131072,
+    "meta-llama/Llama-3.1-8B-Instruct": 131072,
+}
+DEFAULT_CONTEXT_TOKENS = 8192
+PROMPT_OVERHEAD_TOKENS = 400 # instructions and JSON example around the chunk
+MAX_OUTPUT_TOKENS = 2048
+
+# Questions asked per chunk, proportional to its length
+QUESTIONS_PER_1000_TOKENS = 7
+MIN_QUESTIONS_PER_CHUNK = 2
+MAX_QUESTIONS_PER_CHUNK = 10
+
+CHARS_PER_TOKEN = 4 # rough estimate for English text with Llama tokenizers
+
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+SENTENCE_END = re.compile(r'(?:(?<=[.!?])|(?<=[.!?]["\')\]]))\s+')
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def chunk_token_budget(model_name, max_output_tokens=MAX_OUTPUT_TOKENS):
+    context = MODEL_CONTEXT_TOKENS.get(model_name, DEFAULT_CONTEXT_TOKENS)
+    return max(1, min(CHUNK_TOKEN_BUDGET, context - PROMPT_OVERHEAD_TOKENS - max_output_tokens))
+
+
+def questions_for_chunk(text):
+    """Number of questions to ask for a chunk, by its length."""
+    wanted = round(estimate_tokens(text) * QUESTIONS_PER_1000_TOKENS / 1000)
+    return max(MIN_QUESTIONS_PER_CHUNK, min(MAX_QUESTIONS_PER_CHUNK, wanted))
+
+
+def split_sentences(paragraph, token_budget):
+    """Sentences of a paragraph; a sentence longer than the budget is cut between words."""
+    for sentence in SENTENCE_END.split(paragraph):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if estimate_tokens(sentence) <= token_budget:
+            yield sentence
+            continue
+        words = sentence.split()
+        piece = []
+        piece_tokens = 0
+        for word in words:
+            word_tokens = estimate_tokens(word + " ")
+            if piece and piece_tokens + word_tokens > token_budget:
+                yield " ".join(piece)
+                piece, piece_tokens = [], 0
+            piece.append(word)
+            piece_tokens += word_tokens
+        if piece:
+            yield " ".join(piece)
+
+
+def chunk_text(text, token_budget=CHUNK_TOKEN_BUDGET, overlap_sentences=CHUNK_OVERLAP_SENTENCES):
+    """
+    Splits text into chunks of at most ~token_budget tokens on sentence boundaries,
+    closing a chunk at a paragraph break once it is at least half full.
+    With overlap_sentences > 0 every chunk starts with the last sentences of the previous one.
+    """
+    chunks = [] # lists of sentences
+    current = []
+    current_tokens = 0
+    fresh = 0 # sentences in `current` that are not overlap from the previous chunk
+
+    def close_current():
+        nonlocal current, current_tokens, fresh
+        chunks.append(current)
+        current = current[-overlap_sentences:] if overlap_sentences > 0 else []
+        current_tokens = sum(estimate_tokens(s) + 1 for s in current)
+        fresh = 0
+
+    for paragraph in PARAGRAPH_BREAK.split(text):
+        for sentence in split_sentences(paragraph, token_budget):
+            sentence_tokens = estimate_tokens(sentence) + 1
+            if fresh and current_tokens + sentence_tokens > token_budget:
+                close_current()
+            current.append(sentence)
+            current_tokens += sentence_tokens
+            fresh += 1
+        if fresh and current_tokens >= token_budget // 2:
+            close_current()
+    if fresh:
+        chunks.append(current)
+
+    # A short tail is not worth its own request
+    if len(chunks) > 1:
+        tail = chunks[-1][min(overlap_sentences, len(chunks[-2])):] if overlap_sentences > 0 else chunks[-1]
+        if sum(estimate_tokens(s) + 1 for s in tail) < token_budget * MIN_CHUNK_FRACTION:
+            chunks.pop()
+            chunks[-1] = chunks[-1] + tail
+
+    return [" ".join(sentences) for sentences in chunks]
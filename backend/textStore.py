@@ -0,0 +1,47 @@
+import json
+import os
+import threading
+
+# Layout of the extracted texts, shared by the Flask app and the generators
+TEXTS_FOLDER = os.path.join("res", "texts")
+MAIN_TEXTS_FOLDER = os.path.join(TEXTS_FOLDER, "main_text") # {"main_text": ...} response bodies, served as is
+
+
+def texts_json_path(filename):
+    return os.path.join(TEXTS_FOLDER, f"{os.path.splitext(filename)[0]}.json")
+
+
+def main_text_path(filename):
+    return os.path.join(MAIN_TEXTS_FOLDER, f"{os.path.splitext(filename)[0]}.json")
+
+
+def save_main_text(filename, main_text):
+    # Pre-encoded /get_file_content body; written to a temporary file first so it is never served half-written
+    path = main_text_path(filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp" # one per writer: the same file may be uploaded twice at once
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({'main_text': main_text}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_main_text(filename):
+    """
+    Main text extracted from an uploaded file, read straight from res/texts.
+    Raises FileNotFoundError if the file was never extracted.
+    """
+    path = main_text_path(filename)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get('main_text', "")
+    json_path = texts_json_path(filename)
+    if not os.path.exists(json_path):
+        raise FileNotFoundError(f"No extracted text for '{filename}' (looked for {path} and {json_path})")
+    with open(json_path, "r", encoding="utf-8") as f:
+        return json.load(f).get("content", {}).get("main_text", "")
+
+
+def get_materials(filename):
+    """In-process replacement for fetching /get_file_content: returns (main_text, word_count)."""
+    text = load_main_text(filename)
+    return text, len(text.split())